@@ -22,6 +22,11 @@
 #-- import libraries --#
 #----------------------#
 import gdal
+from general_code.netcdf import (Cube, open_cube, point_slice, time_slice,
+                                 point_time_slice, make_ncdf,
+                                 export_point_store, open_point_store,
+                                 detect_events)
+from general_code.regrid import regrid_weights, regrid
 import numpy as np
 import netCDF4
 from netCDF4 import Dataset
@@ -32,96 +37,9 @@ import pandas as pd
 #----------------------#
 #-- define functions --#
 #----------------------#
-def find_nearest(coordinate, coordinate_matrix):
-    '''Finds index of nearest value in array (sub-function of other functions)
-
-    Args:
-        coordinate:  individual coordinate (lat or lon)
-        coordinate_matrix:  matrix of coordinates to search for nearest value
-
-    Returns:
-        List of indices of nearest value
-    '''
-    idx = (np.abs(coordinate_matrix - coordinate)).argmin()
-    return idx
-
-def point_slice(latitude, longitude):
-    '''Creates time series of temperatures from single set of coordinates
-
-    Args:
-        latitude:  latitude of interest
-        longitude:  longitude of interest
-
-    Returns:
-        Dataframe containing time series of temperatures
-    '''
-    lon1 = find_nearest(latitude, lats)
-    lat1 = find_nearest(longitude, lons)
-    values = data[0:len(dates), lat1, lon1]
-    result = pd.DataFrame({'values': values, 'dates': dates})
-    return result
-
-def time_slice(start_date, end_date):
-    '''Creates statewide temperature grid from specified dates(s)
-
-    Args:
-        start_date:  first date of time slice (YYYYMMDD)
-        end_date:  last date of time slice (YYYYMMDD)
-
-    Returns:
-        Array of temperatures
-    '''
-    indices = np.flatnonzero((dates >= start_date) & (dates <= end_date)).tolist()
-    values = data[indices, 0:len(lats), 0:len(lons)]
-    return values
-
-def point_time_slice(latitude, longitude, start_date, end_date):
-    '''Creates time series of temperatures from a single specified set of 
-       coordinates and dates
-
-    Args:
-        latitude:  latitude of interest
-        longitude:  longitude of interest
-        start_date:  first date of time slice (YYYYMMDD)
-        end_date:  last date of time slice (YYYYMMDD)
-
-    Returns:
-        Dataframe of temperatures
-    '''
-    lon1 = find_nearest(latitude, lats)
-    lat1 = find_nearest(longitude, lons)
-    indices = np.flatnonzero((dates >= start_date) & (dates <= end_date)).tolist()
-    values = data[indices, lat1, lon1]
-    result = pd.DataFrame({'values': values, 'dates': dates[indices]})
-    return result
-
-def make_ncdf(outpath, data_slice):
-    '''Creates netcdf from data slices
-
-    Args:
-        outpath:  output file path (e.g. 'path/to/outfile.nc')
-        data_slice:  time slice of array (from 'time_slice' function)
-
-    Returns:
-        Dataframe of temperatures
-    '''
-    try:
-        date_slice = dates[(dates >= start_date) & (dates <= end_date)]
-        nc_new = Dataset(outpath, 'w', format ='NETCDF4_CLASSIC')
-        nc_new.createDimension('longitude',  len(lons))
-        nc_new.createDimension('latitude',  len(lats))
-        nc_new.createDimension('time', len(date_slice))
-        longitudes = nc_new.createVariable('longitude', np.float32, ('longitude',))
-        latitudes  = nc_new.createVariable('latitude',  np.float32, ('latitude',))
-        time       = nc_new.createVariable('time',      np.int,     ('time',))
-        data       = nc_new.createVariable('data',      np.float32, ('time', 'latitude', 'longitude'))
-        nc_new.variables['latitude'][:]  = lats
-        nc_new.variables['longitude'][:] = lons
-        nc_new.variables['time'][:]      = date_slice
-        nc_new.variables['data'][:]      = data_slice
-    finally:
-        # remove file from memory
-        nc_new.close()
+## the query functions (find_nearest, point_slice, time_slice,
+## point_time_slice, make_ncdf) are in general_code/netcdf.py; they take
+## the lats/lons/dates/data read below as a single 'cube' argument
 
 
 #-----------------#
@@ -140,6 +58,12 @@ lats = nc.variables['latitude'][:]   # decimal degrees
 dates = nc.variables['time'][:]   # date in YYYYMMDD format (19810101 to 20161030)
 data = nc.variables['data'][:]   # returns a lons x lats x time shaped matrix (53x49x13087)
 
+## bundle the axes and data for the query functions
+cube = Cube(lats=lats, lons=lons, dates=dates, data=data)
+
+## or leave the data on disk, so each query reads only the cells it needs
+cube = open_cube(filepath)
+
 
 #------------------------------------#
 #-- pre-defined basic data queries --#
@@ -150,7 +74,8 @@ longitude = -106
 latitude  = 35
 
 result = point_slice(latitude=latitude,
-                     longitude=longitude)
+                     longitude=longitude,
+                     cube=cube)
 
 
 ## (2) Get time slice of single point
@@ -163,7 +88,8 @@ end_date   = 20160701
 result = point_time_slice(latitude=latitude,
                           longitude=longitude,
                           start_date=start_date,
-                          end_date=end_date)
+                          end_date=end_date,
+                          cube=cube)
 
 
 ## (3) Get time slice of statewide grid
@@ -172,7 +98,31 @@ start_date = 20160101
 end_date   = 20160701
 
 result = time_slice(start_date=start_date,
-                    end_date=end_date)
+                    end_date=end_date,
+                    cube=cube)
+
+
+#-------------------------------------------#
+#-- fast point queries from a point store --#
+#-------------------------------------------#
+## one-time export: transposes data to (lat, lon, time) in a memory-mapped
+## file, so each point's full series is stored contiguously on disk
+storedir = 'path/to/point_store'
+export_point_store(cube=cube, outdir=storedir)
+
+## later sessions just open the store (the data stays on disk)
+store = open_point_store(storedir)
+
+## same query functions as above, each now a single contiguous read
+result = point_slice(latitude=latitude,
+                     longitude=longitude,
+                     cube=store)
+
+result = point_time_slice(latitude=latitude,
+                          longitude=longitude,
+                          start_date=start_date,
+                          end_date=end_date,
+                          cube=store)
 
 
 #----------------------------------------#
@@ -185,11 +135,39 @@ outpath = 'path/to/output_file.nc'
 
 ## slice data
 data_slice = time_slice(start_date=start_date,
-                        end_date=end_date)
+                        end_date=end_date,
+                        cube=cube)
 
 ## create netcdf
 make_ncdf(outpath=outpath,
-          data_slice=data_slice)
+          data_slice=data_slice,
+          cube=cube,
+          start_date=start_date,
+          end_date=end_date)
+
+
+#---------------------------------------------#
+#-- heat waves / cold spells for every cell --#
+#---------------------------------------------#
+## events are runs of at least min_days days whose 'window'-day rolling mean
+## is above (or, with below=True, under) each cell's own percentile
+outpath = 'path/to/heat_waves.nc'   # daily event lengths (0 outside events)
+
+heat = detect_events(cube=cube,
+                     window=3,
+                     percentile=95,
+                     min_days=3,
+                     outpath=outpath)
+heat.count     # (lat x lon) number of events per cell
+heat.longest   # longest event per cell (days)
+
+cold = detect_events(cube=cube,
+                     window=3,
+                     percentile=5,
+                     min_days=3,
+                     below=True,
+                     start_date=19910101,
+                     end_date=20101231)
 
 
 #-------------------------------------------#
@@ -201,7 +179,8 @@ outpath = 'path/to/output_file.tif'
 
 ## get time slice of data
 z = time_slice(start_date=date,
-               end_date=date)
+               end_date=date,
+               cube=cube)
 
 ## define raster parameters
 ntimes, nrows, ncols = np.shape(z)
@@ -217,3 +196,48 @@ output_raster.SetGeoTransform(geotransform)
 output_raster.SetProjection(srs.ExportToWkt()) 
 output_raster.GetRasterBand(1).WriteArray(np.flipud(z[0, :, :]))
 del(output_raster)
+
+
+#-----------------------------------------------------#
+#-- regrid all dates onto a (projected) raster grid --#
+#-----------------------------------------------------#
+## instead of writing a raster per date and running gdalwarp on each, compute
+## the weights to the target grid once (cached in weights_dir) and apply them
+## to every date with sparse matrix multiplies
+target = gdal.Open('path/to/projected_raster.tif')
+weights_dir = 'path/to/regrid_weights'
+outpath = 'path/to/regridded.tif'   # one band per date
+
+regridder = regrid_weights(cube=cube,
+                           geotransform=target.GetGeoTransform(),
+                           shape=(target.RasterYSize, target.RasterXSize),
+                           projection=target.GetProjection(),
+                           method='bilinear',   # or 'conservative' (area-weighted)
+                           cache_dir=weights_dir)
+
+regrid(cube=cube,
+       regridder=regridder,
+       start_date=20160101,
+       end_date=20161030,
+       outpath=outpath)
+
+## or keep the result as a (time x rows x cols) array
+z = regrid(cube=cube,
+           regridder=regridder,
+           start_date=20160704,
+           end_date=20160704)
+
+
+#-------------------------------------------#
+#-- query service for apps (many queries) --#
+#-------------------------------------------#
+## rather than opening the netcdf for every request, run the service once
+## (keeps files open and shares reads between simultaneous requests)
+python -m general_code serve --port 8765
+
+## then query it from the app (point: arrow table; grid: dates and array)
+from general_code import service
+table = service.request(port=8765, query='point', filepath=filepath,
+                        lat=35, lon=-106, start=20160101, end=20160701)
+dates, z = service.request(port=8765, query='grid', filepath=filepath,
+                           start=20160704, end=20160704)
@@ -17,6 +17,13 @@
 #-- import libraries --#
 #----------------------#
 import csv
+from general_code.data import (LazyFrame, build_join_index, chunked_groupby,
+                               indexed_merge, join_stats, multi_merge,
+                               partitioned_pivot, read_csv_with_schema,
+                               read_excel_cached, read_parquet_dataset,
+                               stream_drop_duplicates, stream_melt,
+                               stream_vertical_merge, to_parquet_dataset,
+                               vertical_merge)
 import glob
 import inspect
 import numpy as np
@@ -84,9 +91,20 @@ xl = pd.ExcelFile("excel_spreadsheet1.xlsx")
 xl.sheet_names
 df = xl.parse("values")
 
+## read many sheets in parallel, cached as parquet; a workbook is only
+## re-parsed when its contents change (checked by size/mtime, then sha1)
+sheets = read_excel_cached("excel_spreadsheet1.xlsx", sheets=['values'], processes=4)
+df = sheets['values']
+
 ## write csv
 df1.to_csv(path1 + "written1.csv", index=False)
 
+## convert csv/excel to parquet once, then read only the needed columns/rows
+to_parquet_dataset('CSV_file1.csv', path1 + '/CSV_file1_parquet')
+df1 = read_parquet_dataset(path1 + '/CSV_file1_parquet',
+                           columns=['colname1', 'colname2', 'colname3'],
+                           filters=[('colname2', '<', 5), ('colname3', '>', 5)])   # same as the query() example below
+
 
 #---------------------#
 #-- data attributes --#
@@ -131,6 +149,20 @@ df1.iat[3, 1]            # index based lookup; first is row, second is column
 ## subset to list of matching values
 df[df['colname1'].isin([3, 6])]
 
+## lazy subsetting of a csv/parquet file: filter/select/sort steps are
+## recorded and run together by collect(), so the filters become a single
+## mask per chunk (or parquet predicate pushdown) and only the columns that
+## are selected, filtered, or sorted on are ever read
+
+## same as df1[(df1.colname2 < 5) & (df1.colname3 > 5)][['colname1', 'colname2']].sort_values(by='colname1')
+df = (LazyFrame('CSV_file1.csv')
+      .filter('colname2', '<', 5)
+      .filter('colname3', '>', 5)
+      .isin('colname1', [3, 6])
+      .select(['colname1', 'colname2'])
+      .sort_values('colname1')
+      .collect())
+
 
 #-------------------------------------------------#
 #-- create new dataframe from subset of columns --#
@@ -189,26 +221,28 @@ pd.merge(df1, df2, how='right', left_on=['colname2'], right_on=['b'])   # keeps
 pd.merge(df1, df2, how='inner', left_on=['colname2'], right_on=['b'])   # keeps only common indices
 pd.merge(df1, df2, how='outer', left_on=['colname2'], right_on=['b'])   # keeps all
 
+## repeated joins against the same lookup table: hash its keys once and
+## reuse the index (keys must be unique in the lookup table)
+df2_index = build_join_index(df2, 'b')
+join_stats(df1, df2_index, 'colname2')
+indexed_merge(df1, df2_index, 'colname2', how='left')    # same as the left merge above
+indexed_merge(df1, df2_index, 'colname2', how='inner')   # same as the inner merge above
+
 ## merge many files left/right with common column name
 import_list = glob.glob(path1 + '/*.csv')
 file_list = [pd.read_csv(file) for file in import_list]
 merged = reduce(lambda left, right: pd.merge(left, right, how='outer', on='a'), file_list)
 
-## vertical merge files with same column names
-def vertical_merge(inpath, outpath):
-	'''performs vertical merge of all .csvs in 'inpath' folder and writes to file
+## or, align all files in one step (faster for many files; the key must be
+## unique within each file)
+merged = multi_merge(import_list, on='a')
 
-	Args:
-		inpath:  path to csvs (all must have same columns)
-		outpath: path for merged file to be written
+## vertical merge files with same column names
+vertical_merge(path1, path1 + '/merged.csv')
 
-	Returns:
-		a single csv containing all vertically stacked individual csvs, written to outpath
-	'''
-	import_list = glob.glob(inpath + '/*.csv')
-	file_list = [pd.read_csv(file) for file in import_list]
-	merged = pd.concat(file_list)
-	merged.to_csv(outpath, index=False)
+## streaming vertical merge (for many/large files)
+stream_vertical_merge(path1 + '/daily_extracts', path1 + '/merged.parquet',
+                      output_format='parquet', processes=4)
 
 
 #--------------------#
@@ -223,6 +257,15 @@ counts.columns = ['group', 'agg1', 'agg2', 'agg3']
 ## specify which columns to aggregate
 counts = df1.groupby(['colname3'])[['colname1']].agg(['count'])
 
+## aggregate chunked input (e.g. pd.read_csv(..., chunksize=100000)) without
+## loading the whole file; each chunk is reduced to per-group partial results
+## (count, sum, min, max, sum of squared deviations, random sample) that are
+## merged as they arrive
+reader = pd.read_csv('CSV_file1.csv', chunksize=100000)
+counts = chunked_groupby(reader, by=['colname3'], columns=['colname1', 'colname2'],
+                         quantiles=[0.5, 0.9], processes=4)
+counts.xs('count', axis=1, level=1)   # same as df1.groupby(['colname3'])[['colname1', 'colname2']].count()
+
 
 #------------------#
 #-- reshape data --#
@@ -239,6 +282,13 @@ df = pd.melt(df, id_vars=['A'])   # leave value_vars arg empty to treat all colu
 ## long to wide
 df = df.pivot(index='A', columns='variable', values='value') # for multiple indices, specify as a list
 pd.DataFrame(df.to_records())
+df = df.reset_index()   # same result, without the copy through a record array
+df.columns.name = None
+
+## for files too large to reshape in memory, reshape in chunks and write parquet
+stream_melt('census_wide.csv', path1 + '/census_long.parquet', id_vars=['GEOID'])
+partitioned_pivot(path1 + '/census_long.parquet', path1 + '/census_wide.parquet',
+                  index=['GEOID'], columns='variable', values='value')
 
 
 #------------------------------#
@@ -256,9 +306,20 @@ df1.drop_duplicates('colname3', keep=False)     # remove all duplicates
 df1[df1.duplicated('colname3',  keep=False)]    # return all duplicated rows
 df1.colname3.unique()                           # return all unique elements/levels
 
+## drop duplicates from a file too large to load; rows are reduced to 64-bit
+## key hashes (16 bytes per row with row numbers), which spill to temporary
+## files split by hash once they pass 'max_memory'. Results match
+## drop_duplicates(subset, keep=keep) apart from (very unlikely) hash collisions.
+stream_drop_duplicates('CSV_file1.csv', path1 + '/deduplicated.csv', ['colname3'], keep='first')
+
 
 #-----------------------#
 #-- convert data type --#
 #-----------------------#
 df1['test'] = df1['colname1'].astype(str)
 pd.to_numeric(df1['test'], errors='coerce')
+
+## or set compact types while parsing, from a schema inferred on a sample of
+## rows and cached next to the file (e.g. 'file.csv.schema.json')
+df1 = read_csv_with_schema('CSV_file1.csv')
+df1.dtypes
@@ -22,6 +22,8 @@
 #-- import libraries --#
 #----------------------#
 import gdal
+from general_code.netcdf import (Cube, open_cube, point_slice, time_slice,
+                                 point_time_slice, make_ncdf)
 import numpy as np
 import netCDF4
 from netCDF4 import Dataset
@@ -32,65 +34,9 @@ import pandas as pd
 #----------------------#
 #-- define functions --#
 #----------------------#
-#### finds index of nearest value in array (sub-function of other functions)
-## @param coordinate:  individual coordinate
-## @param coordinate_matrix:  matrix of coordinates to search for nearest value
-def find_nearest(coordinate, coordinate_matrix):
-    idx = (np.abs(coordinate_matrix - coordinate)).argmin()
-    return idx
-
-#### returns time series of temperatures from a single specified set of coordinates
-## @param latitude:  latitude of interest
-## @param longitude:  longitude of interest
-def point_slice(latitude, longitude):
-    lon1 = find_nearest(latitude, lats)
-    lat1 = find_nearest(longitude, lons)
-    values = data[0:len(dates), lat1, lon1]
-    result = pd.DataFrame({'values': values, 'dates': dates})
-    return result
-
-#### returns statewide temperature grid from specified dates(s)
-## @param start_date:  first date of time slice (YYYYMMDD)
-## @param end_date:  last date of time slice (YYYYMMDD)
-def time_slice(start_date, end_date):
-    indices = np.flatnonzero((dates >= start_date) & (dates <= end_date)).tolist()
-    values = data[indices, 0:len(lats), 0:len(lons)]
-    return values
-
-#### returns time series of temperatures from a single specified set of coordinates and dates
-## @param latitude:  latitude of interest
-## @param longitude:  longitude of interest
-## @param start_date:  first date of time slice (YYYYMMDD)
-## @param end_date:  last date of time slice (YYYYMMDD)
-def point_time_slice(latitude, longitude, start_date, end_date):
-    lon1 = find_nearest(latitude, lats)
-    lat1 = find_nearest(longitude, lons)
-    indices = np.flatnonzero((dates >= start_date) & (dates <= end_date)).tolist()
-    values = data[indices, lat1, lon1]
-    result = pd.DataFrame({'values': values, 'dates': dates[indices]})
-    return result
-
-#### Create netcdfs from data slices
-## @param outpath:  output file path (e.g. 'path/to/outfile.nc')
-## @param data_slice:  time slice of array
-def make_ncdf(outpath, data_slice):
-    try:
-        date_slice = dates[(dates >= start_date) & (dates <= end_date)]
-        nc_new = Dataset(outpath, 'w', format ='NETCDF4_CLASSIC')
-        nc_new.createDimension('longitude',  len(lons))
-        nc_new.createDimension('latitude',  len(lats))
-        nc_new.createDimension('time', len(date_slice))
-        longitudes = nc_new.createVariable('longitude', np.float32, ('longitude',))
-        latitudes  = nc_new.createVariable('latitude',  np.float32, ('latitude',))
-        time       = nc_new.createVariable('time',      np.int, ('time',))
-        data       = nc_new.createVariable('data',      np.float32, ('time', 'latitude', 'longitude'))
-        nc_new.variables['latitude'][:]  = lats
-        nc_new.variables['longitude'][:] = lons
-        nc_new.variables['time'][:]      = date_slice
-        nc_new.variables['data'][:]      = data_slice
-    finally:
-        # remove file from memory
-        nc_new.close()
+## the query functions (find_nearest, point_slice, time_slice,
+## point_time_slice, make_ncdf) are in general_code/netcdf.py; they take
+## the lats/lons/dates/data read below as a single 'cube' argument
 
 
 #-----------------#
@@ -109,6 +55,12 @@ lats = nc.variables['latitude'][:]   # decimal degrees
 dates = nc.variables['time'][:]   # date in YYYYMMDD format (19810101 to 20161030)
 data = nc.variables['data'][:]   # returns a lons x lats x time shaped matrix (53x49x13087)
 
+## bundle the axes and data for the query functions
+cube = Cube(lats=lats, lons=lons, dates=dates, data=data)
+
+## or leave the data on disk, so each query reads only the cells it needs
+cube = open_cube(filepath)
+
 
 #------------------------------------#
 #-- pre-defined basic data queries --#
@@ -120,7 +72,8 @@ latitude  = 35
 
 # run process
 result = point_slice(latitude = latitude,
-                     longitude = longitude)
+                     longitude = longitude,
+                     cube = cube)
 
 
 ## (2) time slice of single point
@@ -134,7 +87,8 @@ end_date   = 20160701
 result = point_time_slice(latitude = latitude,
                           longitude = longitude,
                           start_date = start_date,
-                          end_date = end_date)
+                          end_date = end_date,
+                          cube = cube)
 
 
 ## (3) time slice of statewide grid
@@ -144,7 +98,8 @@ end_date   = 20160701
 
 # run process
 result = time_slice(start_date = start_date,
-                    end_date = end_date)
+                    end_date = end_date,
+                    cube = cube)
 
 
 #----------------------------------------#
@@ -157,11 +112,15 @@ outpath = 'path/to/output_file.nc'
 
 ## slice data
 data_slice = time_slice(start_date = start_date,
-                        end_date = end_date)
+                        end_date = end_date,
+                        cube = cube)
 
 ## create netcdf
 make_ncdf(outpath = outpath,
-          data_slice = data_slice)
+          data_slice = data_slice,
+          cube = cube,
+          start_date = start_date,
+          end_date = end_date)
 
 
 #-------------------------------------------#
@@ -173,7 +132,8 @@ outpath = 'path/to/output_file.tif'   # define output file path
 
 ## get time slice of data
 z = time_slice(start_date = date,
-               end_date = date)
+               end_date = date,
+               cube = cube)
 
 ## define raster parameters
 ntimes, nrows, ncols = np.shape(z)
@@ -16,6 +16,8 @@
 #----------------------#
 #-- import libraries --#
 #----------------------#
+from general_code.raster import map_lookup, read_display_array, render_frames
+import glob
 import matplotlib.pyplot as plt
 from mpl_toolkits.basemap import Basemap
 import numpy as np
@@ -100,6 +102,9 @@ gdalwarp -t_srs "EPSG:_____" input.tif output.tif
 ## e.g.
 gdalwarp -t_srs "EPSG:102003" P:\Jason\GIS\_CODE\sample_data\NM_temperature_raster.tif P:\Jason\GIS\_CODE\sample_data\reprojected_raster.tif
 
+## to put the netcdf cube (all dates) on a projected grid, see the regrid
+## section of Python_netcdf_basics.py (weights are computed once and reused)
+
 
 #--------------------------------#
 #-- zonal stats/point sampling --#
@@ -240,3 +245,43 @@ cbar = m.colorbar(cs, location='bottom', pad='10%')
 ## title
 plt.title('plot title')
 plt.show()
+
+
+#-------------------------------------------------------#
+#-- plot many frames (e.g. daily maps) at display res --#
+#-------------------------------------------------------#
+## pcolor on a full-resolution meshgrid projects and draws every cell on
+## every call.  Instead, read each raster at display resolution (gdal uses
+## the file's overviews for this), work out once which source pixel falls
+## in each cell of a regular grid in map coordinates, and then draw every
+## frame as an image by indexing into it.
+
+## e.g. daily temperature rasters
+## (build overviews once so downsampled reads are cheap; opened read-only,
+## gdal writes them to an external .ovr file and leaves the .tif untouched)
+paths = sorted(glob.glob('P:/Jason/GIS/_CODE/sample_data/daily/*.tif'))
+for path in paths:
+    ds = gdal.Open(path)
+    if ds.GetRasterBand(1).GetOverviewCount() == 0:
+        ds.BuildOverviews('AVERAGE', [2, 4, 8, 16])
+    del(ds)
+
+frames = []
+for path in paths:
+    data, gt = read_display_array(gdal.Open(path), max_size=800)
+    frames.append(data)
+
+fig = plt.figure(figsize=(12, 6))
+m = Basemap(width=2000000,
+            height=1500000,
+            resolution='l',
+            projection='stere',
+            lat_ts=40,
+            lat_0=34.5,
+            lon_0=-106)
+m.drawstates()
+lookup = map_lookup(m, gt, frames[0].shape, nx=800, ny=600)
+
+outpaths = [path.replace('.tif', '.png') for path in paths]
+render_frames(frames, m, lookup, outpaths, titles=paths,
+              vmin=np.nanmin(frames), vmax=np.nanmax(frames))
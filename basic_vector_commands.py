@@ -17,9 +17,12 @@
 #-- import libraries --#
 #----------------------#
 import fiona
+from general_code.vector import (build_key_index, join_attributes,
+                                 new_raster_from_base, render_choropleths)
 import geopandas as gpd
 import json
 import matplotlib.pyplot as plt
+import numpy as np
 import ogr
 import osr
 import pandas as pd
@@ -108,6 +111,19 @@ fig.colorbar(sm, cax=cax)
 
 plt.show()
 
+## batch chloropleth maps (many variables, shared geometry)
+## geometry is converted to a patch collection once per worker process;
+## each map after that only swaps face colors and re-saves the figure
+vrbls = ['HOMEVAL', 'MEDINC', 'POP']
+outdir = 'P:/Jason/GIS/_CODE/sample_data/maps'
+outpaths = render_choropleths(merged, vrbls, outdir, processes=4)
+
+## same color scale on every map (e.g. one column per date)
+dates = ['POP2000', 'POP2010']
+outpaths = render_choropleths(merged, dates, outdir, processes=4,
+                              vmin=merged[dates].min().min(),
+                              vmax=merged[dates].max().max())
+
 
 #----------------------#
 #-- rasterize vector --#
@@ -119,25 +135,6 @@ gdal_rasterize -b 1 -i -burn -32678 -l layername input.shp input.tif
 from osgeo import ogr
 from osgeo import gdal
 
-def new_raster_from_base(base, outputURI, format, nodata, datatype):
-    cols = base.RasterXSize
-    rows = base.RasterYSize
-    projection = base.GetProjection()
-    geotransform = base.GetGeoTransform()
-    bands = base.RasterCount
-
-    driver = gdal.GetDriverByName(format)
-
-    new_raster = driver.Create(str(outputURI), cols, rows, bands, datatype)
-    new_raster.SetProjection(projection)
-    new_raster.SetGeoTransform(geotransform)
-
-    for i in range(bands):
-        new_raster.GetRasterBand(i + 1).SetNoDataValue(nodata)
-        new_raster.GetRasterBand(i + 1).Fill(nodata)
-
-    return new_raster
-
 template_path = 'P:/Jason/GIS/_CODE/sample_data/NM_temperature_raster.tif'  # template raster for extents, resolutions
 shape_path = 'P:/Jason/GIS/_CODE/sample_data/NM_counties.geojson'
 raster_out = 'P:/Jason/GIS/_CODE/sample_data/county_raster.tif'
@@ -177,6 +174,16 @@ df = pd.read_csv('P:/Jason/GIS/Census/tabular_data/tract_data.csv')
 df['GEOID'] = df['GEOID'].astype(str)   # needed for this example
 merged = geom.merge(df, on='GEOID')
 
+## for wide tables, read only the needed columns and only the rows whose
+## key is in the geometry; GEOIDs are read as categoricals whose categories
+## are the geometry's GEOIDs, so the category codes are row positions
+keys = build_key_index(geom, 'GEOID')
+merged = join_attributes(geom,
+                         'P:/Jason/GIS/Census/tabular_data/tract_data.csv',
+                         columns=['HOMEVAL', 'MEDINC', 'POP'],
+                         dtypes={'HOMEVAL': 'float32', 'MEDINC': 'float32', 'POP': 'int32'},
+                         key_index=keys)
+
 
 #-------------------#
 #-- spatial joins --#
@@ -0,0 +1,305 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## reproducible benchmarks for the hot paths in the netcdf, raster, vector,
+## and dataframe helpers. Synthetic inputs are generated locally, each case
+## is timed, and wall time, throughput, and peak memory are appended to a
+## json history so runs can be compared, e.g.
+##
+##   python benchmark_hot_paths.py --size small
+##   python benchmark_hot_paths.py --size medium --only point_slice,groupby
+##
+## peak memory is measured with tracemalloc, which sees numpy/pandas
+## allocations but not memory allocated inside gdal/netcdf libraries, and
+## only in this process (cases that start worker processes are marked).
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import argparse
+import datetime
+import glob
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from general_code import data, netcdf
+
+
+#----------------------#
+#-- define functions --#
+#----------------------#
+SIZES = {'small':  {'ntime': 365,   'nlat': 49,  'nlon': 53,  'raster': 500,  'polygons': 100,  'files': 20,  'rows': 10000},
+         'medium': {'ntime': 3650,  'nlat': 49,  'nlon': 53,  'raster': 2000, 'polygons': 400,  'files': 100, 'rows': 50000},
+         'large':  {'ntime': 13087, 'nlat': 49,  'nlon': 53,  'raster': 6000, 'polygons': 1600, 'files': 200, 'rows': 200000}}
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def timed(func, nbytes=None, repeat=3):
+    '''Times a function call, then measures its peak memory in one more call
+       (tracemalloc slows python code down, so it is kept out of the timing)
+
+    Args:
+        func:  function with no arguments
+        nbytes:  bytes processed per call (for throughput)
+        repeat:  number of timed calls; the fastest is reported
+
+    Returns:
+        Dictionary of wall time (s), throughput (MB/s), and peak traced memory (MB)
+    '''
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    result = {'seconds': min(times), 'peak_mb': peak / 1024.0 ** 2}
+    if nbytes:
+        result['mb_per_s'] = nbytes / 1024.0 ** 2 / min(times)
+    return result
+
+def make_netcdf(outpath, ntime, nlat, nlon):
+    '''Writes a synthetic (time, latitude, longitude) temperature cube'''
+    from netCDF4 import Dataset
+    nc = Dataset(outpath, 'w', format='NETCDF4_CLASSIC')
+    try:
+        nc.createDimension('longitude', nlon)
+        nc.createDimension('latitude', nlat)
+        nc.createDimension('time', ntime)
+        nc.createVariable('longitude', np.float32, ('longitude',))[:] = np.linspace(-109, -103, nlon)
+        nc.createVariable('latitude', np.float32, ('latitude',))[:] = np.linspace(31.3, 37, nlat)
+        dates = pd.date_range('1981-01-01', periods=ntime).strftime('%Y%m%d').astype(int)
+        nc.createVariable('time', np.int32, ('time',))[:] = dates
+        data = nc.createVariable('data', np.float32, ('time', 'latitude', 'longitude'))
+        rng = np.random.RandomState(0)
+        for i in range(0, ntime, 365):
+            block = data[i:i + 365].shape
+            data[i:i + 365] = 15 + 10 * rng.standard_normal(block).astype(np.float32)
+    finally:
+        nc.close()
+
+def make_geotiff(outpath, size, values=None):
+    '''Writes a synthetic single-band float32 geotiff covering New Mexico'''
+    from osgeo import gdal, osr
+    if values is None:
+        values = np.random.RandomState(0).random_sample((size, size)).astype(np.float32) * 30
+    xres, yres = 6.0 / size, 5.7 / size
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    raster = gdal.GetDriverByName('GTiff').Create(outpath, size, size, 1, gdal.GDT_Float32)
+    raster.SetGeoTransform((-109.0, xres, 0, 37.0, 0, -yres))
+    raster.SetProjection(srs.ExportToWkt())
+    raster.GetRasterBand(1).WriteArray(values)
+    del(raster)
+
+def make_polygons(outpath, n):
+    '''Writes a grid of n square polygons over New Mexico as geojson'''
+    import geopandas as gpd
+    from shapely.geometry import box
+    side = int(np.ceil(np.sqrt(n)))
+    xs, ys = np.linspace(-109, -103, side + 1), np.linspace(31.3, 37, side + 1)
+    polys = [box(xs[i], ys[j], xs[i + 1], ys[j + 1]) for i in range(side) for j in range(side)][:n]
+    gdf = gpd.GeoDataFrame({'NAME': ['poly{0}'.format(i) for i in range(len(polys))]},
+                           geometry=polys, crs='EPSG:4326')
+    gdf.to_file(outpath, driver='GeoJSON')
+    return gdf
+
+def make_csvs(outdir, nfiles, nrows):
+    '''Writes nfiles csvs with the same columns'''
+    rng = np.random.RandomState(0)
+    for i in range(nfiles):
+        df = pd.DataFrame({'colname1': rng.randint(0, 1000, nrows),
+                           'colname2': rng.standard_normal(nrows),
+                           'colname3': rng.randint(0, 50, nrows)})
+        df.to_csv(os.path.join(outdir, 'file{0:04d}.csv'.format(i)), index=False)
+
+
+#---------------------#
+#-- benchmark cases --#
+#---------------------#
+def bench_netcdf(workdir, size, results, only):
+    '''point_slice (from the file and from a point store), time_slice, and
+       make_ncdf on a synthetic cube opened the way the scripts open it (data
+       read from disk on slicing)'''
+    path = os.path.join(workdir, 'cube.nc')
+    make_netcdf(path, size['ntime'], size['nlat'], size['nlon'])
+    cube = netcdf.open_cube(path)
+    try:
+        start_date, end_date = int(cube.dates[0]), int(cube.dates[-1])
+        cube_bytes = size['ntime'] * size['nlat'] * size['nlon'] * 4
+
+        if 'point_slice' in only:
+            results['point_slice'] = timed(lambda: netcdf.point_slice(35, -106, cube), size['ntime'] * 4)
+        if 'point_store' in only:
+            store = netcdf.export_point_store(cube, os.path.join(workdir, 'point_store'))
+            results['point_store'] = timed(lambda: netcdf.point_slice(35, -106, store), size['ntime'] * 4)
+        if 'time_slice' in only:
+            results['time_slice'] = timed(lambda: netcdf.time_slice(start_date, end_date, cube), cube_bytes)
+        if 'make_ncdf' in only:
+            data_slice = netcdf.time_slice(start_date, end_date, cube)
+            outpath = os.path.join(workdir, 'slice.nc')
+            results['make_ncdf'] = timed(lambda: netcdf.make_ncdf(outpath, data_slice, cube), cube_bytes)
+    finally:
+        cube.data.group().close()
+
+def bench_raster(workdir, size, results, only):
+    '''masking with np.where, and zonal stats'''
+    from osgeo import gdal
+    raster_path = os.path.join(workdir, 'raster.tif')
+    mask_path = os.path.join(workdir, 'mask.tif')
+    make_geotiff(raster_path, size['raster'])
+    mask = np.random.RandomState(1).randint(0, 800000, (size['raster'], size['raster']))
+    make_geotiff(mask_path, size['raster'], mask.astype(np.float32))
+
+    if 'masking' in only:
+        def mask_raster():
+            raster_data = gdal.Open(raster_path).ReadAsArray()
+            mask_data = gdal.Open(mask_path).ReadAsArray()
+            return np.where(mask_data > 400000, raster_data, np.nan)
+        results['masking'] = timed(mask_raster, size['raster'] ** 2 * 8)
+    if 'zonal_stats' in only:
+        from rasterstats import zonal_stats
+        poly_path = os.path.join(workdir, 'polygons.geojson')
+        make_polygons(poly_path, size['polygons'])
+        results['zonal_stats'] = timed(lambda: zonal_stats(poly_path, raster_path,
+                                                           stats=['mean', 'max', 'count'],
+                                                           all_touched=True),
+                                       size['raster'] ** 2 * 4, repeat=1)
+
+def bench_vector(workdir, size, results, only):
+    '''point in polygon spatial join'''
+    if 'spatial_join' not in only:
+        return
+    import geopandas as gpd
+    polys = make_polygons(os.path.join(workdir, 'join_polygons.geojson'), size['polygons'])
+    rng = np.random.RandomState(2)
+    npoints = size['rows']
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(rng.uniform(-109, -103, npoints),
+                                                          rng.uniform(31.3, 37, npoints)),
+                              crs='EPSG:4326')
+    results['spatial_join'] = timed(lambda: gpd.sjoin(points, polys, how='left', predicate='intersects'))
+    results['spatial_join']['points_per_s'] = npoints / results['spatial_join']['seconds']
+
+def bench_dataframe(workdir, size, results, only):
+    '''vertical_merge, stream_vertical_merge, and groupby'''
+    inpath = os.path.join(workdir, 'csvs')
+    os.makedirs(inpath)
+    make_csvs(inpath, size['files'], size['rows'])
+    nbytes = sum(os.path.getsize(path) for path in glob.glob(inpath + '/*.csv'))
+    outpath = os.path.join(workdir, 'merged.csv')
+
+    if 'vertical_merge' in only:
+        results['vertical_merge'] = timed(lambda: data.vertical_merge(inpath, outpath), nbytes, repeat=1)
+        results['stream_vertical_merge'] = timed(lambda: data.stream_vertical_merge(inpath, outpath),
+                                                 nbytes, repeat=1)
+        ## files are parsed in worker processes, which tracemalloc does not see
+        results['stream_vertical_merge']['peak_scope'] = 'parent process only'
+    if 'groupby' in only:
+        df = pd.concat([pd.read_csv(path) for path in sorted(glob.glob(inpath + '/*.csv'))])
+        results['groupby'] = timed(lambda: df.groupby(['colname3'])[['colname1', 'colname2']].agg(['count', 'mean']),
+                                   df.memory_usage().sum())
+        chunks = [df.iloc[i:i + size['rows']] for i in range(0, len(df), size['rows'])]
+        results['chunked_groupby'] = timed(lambda: data.chunked_groupby(chunks, ['colname3'], ['colname1', 'colname2']),
+                                           df.memory_usage().sum())
+
+BENCHMARKS = [(bench_netcdf, ['point_slice', 'point_store', 'time_slice', 'make_ncdf']),
+              (bench_raster, ['masking', 'zonal_stats']),
+              (bench_vector, ['spatial_join']),
+              (bench_dataframe, ['vertical_merge', 'groupby'])]
+
+def git_commit():
+    '''Current git commit of the repository, if available'''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=SCRIPT_DIR).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(previous, current):
+    '''Prints the change in wall time against the previous run of the same size'''
+    for name, result in sorted(current['results'].items()):
+        line = '{0:<24}{1:>10.4f} s {2:>10.1f} MB peak'.format(name, result['seconds'], result['peak_mb'])
+        if previous and name in previous['results']:
+            ratio = result['seconds'] / previous['results'][name]['seconds']
+            line += '   {0:+.1%} vs {1}'.format(ratio - 1, previous.get('commit') or previous['timestamp'])
+        if 'peak_scope' in result:
+            line += '   (peak: {0})'.format(result['peak_scope'])
+        print(line)
+
+def run(size_name='small', only=None, history='benchmark_history.json', workdir=None):
+    '''Runs the benchmarks and appends the results to the history file
+
+    Args:
+        size_name:  'small', 'medium', or 'large'
+        only:  optional list of benchmark names to run (default is all)
+        history:  path of the json history file
+        workdir:  folder for synthetic inputs (default is a temporary folder,
+            removed afterwards; a given folder is reused, and each case's
+            subfolder is cleared before it runs)
+
+    Returns:
+        Dictionary of results for this run
+    '''
+    size = SIZES[size_name]
+    names = [name for func, names in BENCHMARKS for name in names]
+    only = set(only or names)
+    temporary = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='bench_')
+
+    results = {}
+    try:
+        for func, names in BENCHMARKS:
+            if only.intersection(names):
+                case_dir = os.path.join(workdir, func.__name__)
+                shutil.rmtree(case_dir, ignore_errors=True)
+                os.makedirs(case_dir)
+                try:
+                    func(case_dir, size, results, only)
+                except ImportError as e:
+                    print('skipping {0}: {1}'.format(func.__name__, e))
+    finally:
+        ## synthetic inputs are ~1.5 GB at --size large
+        if temporary:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    run_record = {'timestamp': datetime.datetime.now().isoformat(),
+                  'commit': git_commit(),
+                  'size': size_name,
+                  'params': size,
+                  'results': results}
+    runs = []
+    if os.path.exists(history):
+        with open(history) as f:
+            runs = json.load(f)
+    previous = [r for r in runs if r['size'] == size_name]
+    compare(previous[-1] if previous else None, run_record)
+    runs.append(run_record)
+    with open(history, 'w') as f:
+        json.dump(runs, f, indent=2)
+    return run_record
+
+
+#--------------------#
+#-- run benchmarks --#
+#--------------------#
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the hot paths of the reference scripts')
+    parser.add_argument('--size', default='small', choices=sorted(SIZES))
+    parser.add_argument('--only', default=None, help='comma-separated benchmark names')
+    parser.add_argument('--history', default='benchmark_history.json')
+    parser.add_argument('--workdir', default=None)
+    args = parser.parse_args()
+    run(args.size, args.only.split(',') if args.only else None, args.history, args.workdir)
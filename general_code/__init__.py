@@ -0,0 +1,32 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## importable versions of the helper functions from the reference scripts:
+##
+##   general_code.netcdf           point/time queries on the NetCDF cube
+##   general_code.raster           raster reading and plotting
+##   general_code.regrid           cached-weight regridding of the cube to raster grids
+##   general_code.service          asyncio point/window query service for the cube
+##   general_code.vector           chloropleths, attribute joins, rasterizing
+##   general_code.data             dataframe i/o, merges, aggregation, reshaping
+##   general_code.instrumentation  opt-in timing and i/o accounting
+##
+## submodules are imported on first access, and heavy dependencies (gdal,
+## netCDF4, matplotlib, geopandas, pandas, ...) only when a function that
+## needs them is first called. 'python -m general_code --help' lists the
+## command line queries.
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import importlib
+
+
+__all__ = ['data', 'instrumentation', 'netcdf', 'raster', 'regrid', 'service', 'vector']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
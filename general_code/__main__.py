@@ -0,0 +1,115 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## command line queries on the NetCDF cube, e.g.
+##
+##   python -m general_code info path/to/netcdf_file.nc
+##   python -m general_code point path/to/netcdf_file.nc --lat 35 --lon -106
+##   python -m general_code point path/to/netcdf_file.nc --lat 35 --lon -106 --start 20160101 --end 20160701
+##   python -m general_code grid path/to/netcdf_file.nc --start 20160101 --end 20160701 --out slice.nc
+##   python -m general_code export-store path/to/netcdf_file.nc path/to/point_store
+##   python -m general_code point path/to/point_store --lat 35 --lon -106
+##   python -m general_code serve --port 8765
+##
+## only netCDF4 and numpy are imported, and only the requested cells are read.
+## 'point' reads from a point store (see export-store) when given its folder.
+## 'serve' answers queries from other processes (see general_code/service.py).
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import argparse
+import asyncio
+import csv
+import os
+import sys
+
+from . import netcdf
+
+
+#----------------------#
+#-- define functions --#
+#----------------------#
+def info(args):
+    '''Prints the extent of the cube'''
+    cube = netcdf.open_cube(args.filepath)
+    print('dates:      {0} to {1} ({2})'.format(cube.dates[0], cube.dates[-1], len(cube.dates)))
+    print('latitudes:  {0} to {1} ({2})'.format(cube.lats.min(), cube.lats.max(), len(cube.lats)))
+    print('longitudes: {0} to {1} ({2})'.format(cube.lons.min(), cube.lons.max(), len(cube.lons)))
+
+def point(args):
+    '''Writes the time series nearest to a point as csv to stdout'''
+    if os.path.isdir(args.filepath):
+        cube = netcdf.open_point_store(args.filepath)
+    else:
+        cube = netcdf.open_cube(args.filepath)
+    dates, values = netcdf.point_series(args.lat, args.lon, cube, args.start, args.end)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['dates', 'values'])
+    writer.writerows(zip(dates.tolist(), values.tolist()))
+
+def grid(args):
+    '''Writes the statewide grid for a date range to a new netcdf'''
+    cube = netcdf.open_cube(args.filepath)
+    data_slice = netcdf.time_slice(args.start, args.end, cube)
+    netcdf.make_ncdf(args.out, data_slice, cube, args.start, args.end)
+
+def export_store(args):
+    '''Writes a pixel-major point store for fast point queries'''
+    netcdf.export_point_store(netcdf.open_cube(args.filepath), args.outdir)
+
+def serve(args):
+    '''Runs the query service until interrupted'''
+    from .service import QueryService
+    query_service = QueryService(max_open=args.max_open, max_workers=args.workers)
+    try:
+        asyncio.run(query_service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        query_service.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m general_code',
+                                     description='queries on the NetCDF temperature cube')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    parser_info = commands.add_parser('info', help='print the extent of the cube')
+    parser_info.add_argument('filepath')
+    parser_info.set_defaults(func=info)
+
+    parser_point = commands.add_parser('point', help='time series nearest to a point, as csv')
+    parser_point.add_argument('filepath', help='netcdf file or point store folder')
+    parser_point.add_argument('--lat', type=float, required=True)
+    parser_point.add_argument('--lon', type=float, required=True)
+    parser_point.add_argument('--start', type=int, default=None, help='first date (YYYYMMDD)')
+    parser_point.add_argument('--end', type=int, default=None, help='last date (YYYYMMDD)')
+    parser_point.set_defaults(func=point)
+
+    parser_grid = commands.add_parser('grid', help='write a date range to a new netcdf')
+    parser_grid.add_argument('filepath')
+    parser_grid.add_argument('--start', type=int, required=True, help='first date (YYYYMMDD)')
+    parser_grid.add_argument('--end', type=int, required=True, help='last date (YYYYMMDD)')
+    parser_grid.add_argument('--out', required=True, help='output netcdf path')
+    parser_grid.set_defaults(func=grid)
+
+    parser_store = commands.add_parser('export-store', help='write a point store for fast point queries')
+    parser_store.add_argument('filepath')
+    parser_store.add_argument('outdir')
+    parser_store.set_defaults(func=export_store)
+
+    parser_serve = commands.add_parser('serve', help='serve point/grid queries on a local socket')
+    parser_serve.add_argument('--host', default='127.0.0.1')
+    parser_serve.add_argument('--port', type=int, default=8765)
+    parser_serve.add_argument('--max-open', type=int, default=8, help='datasets kept open')
+    parser_serve.add_argument('--workers', type=int, default=4, help='read threads')
+    parser_serve.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## placeholder modules for heavy dependencies (gdal, netCDF4, matplotlib,
+## pandas, ...). Importing a general_code submodule doesn't import them;
+## the real module is imported the first time one of its attributes is used.
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import importlib
+import types
+
+
+#----------------------#
+#-- define functions --#
+#----------------------#
+class LazyModule(types.ModuleType):
+    '''Stands in for a module until one of its attributes is first used
+
+    Args:
+        name:  full module name (e.g. 'osgeo.gdal')
+    '''
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_module'] = module
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return '<lazy module {0!r} ({1})>'.format(self.__name__, state)
@@ -0,0 +1,996 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## dataframe helpers from basic_data_commands.py: reading/writing csv,
+## excel, and parquet, merging, aggregating, reshaping, and deduplicating
+## files that are too large to load at once. pandas and pyarrow are
+## imported the first time a function uses them.
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import collections
+import copy
+import glob
+import hashlib
+import json
+import multiprocessing
+import operator
+import os
+import shutil
+import tempfile
+from urllib.parse import quote
+
+from ._lazy import LazyModule
+from .instrumentation import instrument
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+pa = LazyModule('pyarrow')
+pq = LazyModule('pyarrow.parquet')
+
+
+#------------------------#
+#-- import/export data --#
+#------------------------#
+def _file_sha1(path, blocksize=1024 ** 2):
+	'''sha1 of a file's contents (sub-function of read_excel_cached)'''
+	sha1 = hashlib.sha1()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(blocksize), b''):
+			sha1.update(block)
+	return sha1.hexdigest()
+
+def _parse_sheet(args):
+	'''parses one sheet and writes it to parquet (runs in a worker process)'''
+	path, sheet, outpath = args
+	df = pd.read_excel(path, sheet_name=sheet)
+	df.columns = [str(col) for col in df.columns]
+	try:
+		df.to_parquet(outpath + '.tmp', index=False)
+	except (pa.ArrowInvalid, pa.ArrowTypeError):
+		## text columns with mixed value types are stored as text
+		for col in df.columns[df.dtypes == object]:
+			df[col] = df[col].where(df[col].isnull(), df[col].astype(str))
+		df.to_parquet(outpath + '.tmp', index=False)
+	os.replace(outpath + '.tmp', outpath)
+	return sheet
+
+@instrument
+def read_excel_cached(path, sheets=None, cache_dir=None, processes=None):
+	'''reads sheets of an excel workbook, parsing only sheets that are not cached yet
+
+	Args:
+		path:      path to .xls/.xlsx file
+		sheets:    list of sheet names (default is all sheets)
+		cache_dir: folder for cached sheets (default is path + '.cache'); can be shared
+		           by several workbooks, each is cached in its own subfolder
+		processes: number of worker processes for parsing (default is number of cpus)
+
+	Returns:
+		dictionary of {sheet name: dataframe}; column names are returned as text
+	'''
+	## one subfolder (with its own manifest) per workbook, named after the file
+	## plus a hash of its full path, so same-named workbooks do not collide
+	cache_dir = cache_dir or path + '.cache'
+	path_hash = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]
+	workbook_dir = os.path.join(cache_dir, quote(os.path.basename(path), safe='') + '-' + path_hash)
+	manifest_path = os.path.join(workbook_dir, 'manifest.json')
+	stat = os.stat(path)
+	manifest = {}
+	if os.path.exists(manifest_path):
+		with open(manifest_path) as f:
+			manifest = json.load(f)
+
+	if manifest.get('size') == stat.st_size and manifest.get('mtime') == stat.st_mtime:
+		sha1 = manifest['sha1']
+	else:
+		sha1 = _file_sha1(path)
+		if manifest.get('sha1') != sha1:
+			manifest = {'sha1': sha1}   # workbook changed
+	manifest.update(size=stat.st_size, mtime=stat.st_mtime)
+
+	if sheets is None:
+		if 'sheet_names' not in manifest:
+			manifest['sheet_names'] = pd.ExcelFile(path).sheet_names
+		sheets = manifest['sheet_names']
+
+	sheet_dir = os.path.join(workbook_dir, sha1)
+	if not os.path.isdir(sheet_dir):
+		os.makedirs(sheet_dir)
+	sheet_paths = dict((sheet, os.path.join(sheet_dir, quote(sheet, safe='') + '.parquet'))
+	                   for sheet in sheets)
+	tasks = [(path, sheet, sheet_paths[sheet]) for sheet in sheets
+	         if not os.path.exists(sheet_paths[sheet])]
+	if len(tasks) > 1 and processes != 1:
+		pool = multiprocessing.Pool(min(processes or multiprocessing.cpu_count(), len(tasks)))
+		try:
+			pool.map(_parse_sheet, tasks)
+			pool.close()
+			pool.join()
+		finally:
+			pool.terminate()
+	else:
+		for task in tasks:
+			_parse_sheet(task)
+
+	## drop caches of older versions of this workbook
+	for name in os.listdir(workbook_dir):
+		if name != sha1 and os.path.isdir(os.path.join(workbook_dir, name)):
+			shutil.rmtree(os.path.join(workbook_dir, name), ignore_errors=True)
+	with open(manifest_path, 'w') as f:
+		json.dump(manifest, f, indent=2)
+
+	return dict((sheet, pd.read_parquet(sheet_paths[sheet])) for sheet in sheets)
+
+@instrument
+def to_parquet_dataset(inpath, outpath, partition_cols=None, dtype=None,
+                       sheet_name=None, chunksize=500000):
+	'''converts a csv (read in chunks) or an excel sheet to a parquet dataset
+
+	Args:
+		inpath:         path to .csv, .xls, or .xlsx file
+		outpath:        folder for the parquet dataset (replaced if it exists)
+		partition_cols: optional list of columns to partition files by (e.g. ['year'])
+		dtype:          optional dtype dict applied while parsing (keeps types fixed across chunks)
+		sheet_name:     sheet to convert (excel only)
+		chunksize:      number of csv rows converted at a time
+
+	Returns:
+		number of rows written
+	'''
+	if inpath.lower().endswith(('.xls', '.xlsx')):
+		chunks = [pd.read_excel(inpath, sheet_name=sheet_name or 0, dtype=dtype)]
+	else:
+		chunks = pd.read_csv(inpath, dtype=dtype, chunksize=chunksize)
+
+	## write to a temporary folder next to outpath and swap it in at the end,
+	## so reruns replace the dataset instead of adding to it
+	parent = os.path.dirname(os.path.abspath(outpath))
+	tmp_path = tempfile.mkdtemp(prefix='.tmp_parquet_', dir=parent)
+	nrows = 0
+	schema = None
+	try:
+		for i, chunk in enumerate(chunks):
+			table = pa.Table.from_pandas(chunk, preserve_index=False)
+			## every file in the dataset must share one schema, so later chunks
+			## are cast to the first chunk's types
+			if schema is None:
+				schema = table.schema
+			elif not table.schema.equals(schema):
+				try:
+					table = table.cast(schema)
+				except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+					raise ValueError('column types of rows {0}+ do not match the first chunk ({1}); '
+					                 'pass dtype to fix them'.format(nrows, e))
+			## numbered file names, so reading the folder keeps the row order
+			pq.write_to_dataset(table, tmp_path, partition_cols=partition_cols,
+			                    basename_template='part-{0:06d}-{{i}}.parquet'.format(i))
+			nrows += len(chunk)
+		if os.path.isdir(outpath):
+			shutil.rmtree(outpath)
+		elif os.path.exists(outpath):
+			os.remove(outpath)
+		os.rename(tmp_path, outpath)
+	finally:
+		if os.path.isdir(tmp_path):
+			shutil.rmtree(tmp_path, ignore_errors=True)
+	return nrows
+
+def read_parquet_dataset(path, columns=None, filters=None):
+	'''reads a parquet dataset, loading only the requested columns and skipping
+	   partitions/row groups that cannot match the filters
+
+	Args:
+		path:    parquet file or dataset folder
+		columns: optional list of columns to read
+		filters: optional list of (column, op, value) tuples that are all
+		         required to hold, e.g. [('colname2', '<', 5), ('colname3', '>', 5)]
+
+	Returns:
+		dataframe
+	'''
+	return pd.read_parquet(path, engine='pyarrow', columns=columns, filters=filters)
+
+
+#-----------------#
+#-- subset data --#
+#-----------------#
+_FILTER_OPS = {'==': operator.eq,
+               '!=': operator.ne,
+               '<': operator.lt,
+               '<=': operator.le,
+               '>': operator.gt,
+               '>=': operator.ge,
+               'in': lambda values, value: values.isin(value),
+               'not in': lambda values, value: ~values.isin(value)}
+
+def _apply_filters(df, filters):
+	'''rows of df where all (column, op, value) filters hold (sub-function of LazyFrame)'''
+	mask = np.ones(len(df), dtype=bool)
+	for col, op, value in filters:
+		mask &= np.asarray(_FILTER_OPS[op](df[col], value))
+	return df[mask]
+
+def _keeps_missing(op, value):
+	'''whether pandas keeps rows with a missing value for this filter; pyarrow
+	   pushdown drops them for every operator (sub-function of LazyFrame)'''
+	if op in ('!=', 'not in'):
+		return True
+	return op == 'in' and pd.isnull(list(value)).any()
+
+class LazyFrame(object):
+	'''records subsetting steps on a file and runs them in one pass
+
+	Args:
+		path:      path to csv, parquet file, or parquet dataset folder
+		chunksize: number of csv rows filtered at a time
+	'''
+	def __init__(self, path, chunksize=500000):
+		self.path = path
+		self.chunksize = chunksize
+		self.filters = []
+		self.columns = None
+		self.sort_by = None
+		self.ascending = True
+
+	def _copy(self, **changes):
+		new = copy.copy(self)
+		new.__dict__.update(changes)
+		return new
+
+	def filter(self, column, op, value):
+		'''keeps rows where (column op value) holds, e.g. ('colname2', '<', 5)'''
+		if op not in _FILTER_OPS:
+			raise ValueError('unsupported filter operator: {0}'.format(op))
+		return self._copy(filters=self.filters + [(column, op, value)])
+
+	def isin(self, column, values):
+		'''keeps rows where column is in values'''
+		return self.filter(column, 'in', list(values))
+
+	def select(self, columns):
+		'''keeps only the listed columns'''
+		return self._copy(columns=list(columns))
+
+	def sort_values(self, by, ascending=True):
+		'''sorts the result by one or more columns'''
+		by = [by] if isinstance(by, str) else list(by)
+		return self._copy(sort_by=by, ascending=ascending)
+
+	def collect(self):
+		'''reads the file once, applying all recorded steps
+
+		Returns:
+			dataframe
+		'''
+		needed = None
+		if self.columns is not None:
+			needed = list(self.columns)
+			for col in [f[0] for f in self.filters] + (self.sort_by or []):
+				if col not in needed:
+					needed.append(col)
+
+		if self.path.lower().endswith('.csv'):
+			parts = [_apply_filters(chunk, self.filters)
+			         for chunk in _iter_chunks(self.path, self.chunksize, needed)]
+			df = pd.concat(parts, ignore_index=True)
+		else:
+			## filters that keep missing values in pandas are applied after the
+			## read, so both file types give the same rows
+			pushdown = [f for f in self.filters if not _keeps_missing(f[1], f[2])]
+			after = [f for f in self.filters if _keeps_missing(f[1], f[2])]
+			df = read_parquet_dataset(self.path, columns=needed, filters=pushdown or None)
+			if after:
+				df = _apply_filters(df, after).reset_index(drop=True)
+
+		if self.sort_by:
+			df = df.sort_values(by=self.sort_by, ascending=self.ascending)
+		if self.columns is not None:
+			df = df[self.columns]
+		return df
+
+
+#----------------#
+#-- merge data --#
+#----------------#
+JoinIndex = collections.namedtuple('JoinIndex', ['keys', 'table', 'key'])
+
+def build_join_index(ref, key):
+	'''builds a reusable key index for a lookup table
+
+	Args:
+		ref: lookup dataframe (e.g. df2)
+		key: name of its key column (e.g. 'b')
+
+	Returns:
+		JoinIndex(keys, table, key); the keys' hash table is built on first use and kept
+	'''
+	keys = pd.Index(ref[key])
+	if not keys.is_unique:
+		raise ValueError("key '{0}' is not unique in the lookup table; use pd.merge".format(key))
+	return JoinIndex(keys=keys, table=ref.reset_index(drop=True), key=key)
+
+def _assemble_join(left, right, positions, left_on, right_on, how, suffixes):
+	'''lines up right rows with left rows like pd.merge (sub-function of the join helpers)'''
+	matched = positions >= 0
+	if how == 'inner':
+		left, positions = left[matched], positions[matched]
+	elif how != 'left':
+		raise ValueError("how must be 'left' or 'inner'")
+	right = right.reindex(positions)   # position -1 gives a row of NaNs
+	if right_on == left_on:
+		right = right.drop(columns=right_on)
+	overlap = set(left.columns) & set(right.columns)
+	left = left.rename(columns=lambda col: col + suffixes[0] if col in overlap else col)
+	right = right.rename(columns=lambda col: col + suffixes[1] if col in overlap else col)
+	return pd.concat([left.reset_index(drop=True), right.reset_index(drop=True)], axis=1)
+
+def indexed_merge(left, join_index, left_on, how='left', suffixes=('_x', '_y')):
+	'''same as pd.merge(left, ref, how=how, left_on=left_on, right_on=key), using a prebuilt JoinIndex
+
+	Args:
+		left:       dataframe to add columns to (e.g. df1)
+		join_index: output of build_join_index
+		left_on:    key column in left (e.g. 'colname2')
+		how:        'left' or 'inner'
+		suffixes:   added to column names found in both tables
+
+	Returns:
+		merged dataframe
+	'''
+	positions = join_index.keys.get_indexer(left[left_on])
+	return _assemble_join(left, join_index.table, positions, left_on, join_index.key, how, suffixes)
+
+def sorted_merge(left, right, left_on, right_on, how='left', suffixes=('_x', '_y')):
+	'''join for inputs already sorted on their keys (binary search, no hashing);
+	   right keys must be unique
+
+	Args:
+		left:     dataframe sorted by left_on
+		right:    dataframe sorted by right_on, with unique keys
+		left_on:  key column in left
+		right_on: key column in right
+		how:      'left' or 'inner'
+		suffixes: added to column names found in both tables
+
+	Returns:
+		merged dataframe
+	'''
+	left_keys = left[left_on].values
+	right_keys = right[right_on].values
+	if not (right[right_on].is_monotonic_increasing and right[right_on].is_unique):
+		raise ValueError('right keys must be sorted and unique')
+	if not left[left_on].is_monotonic_increasing:
+		raise ValueError('left keys must be sorted')
+	positions = np.searchsorted(right_keys, left_keys)
+	found = positions < len(right_keys)
+	found[found] = right_keys[positions[found]] == left_keys[found]
+	positions = np.where(found, positions, -1)
+	return _assemble_join(left, right.reset_index(drop=True), positions, left_on, right_on, how, suffixes)
+
+def join_stats(left, join_index, left_on):
+	'''reports join cardinality between a table and a prebuilt JoinIndex
+
+	Args:
+		left:       dataframe to be joined
+		join_index: output of build_join_index
+		left_on:    key column in left
+
+	Returns:
+		dictionary of row counts and match rate
+	'''
+	positions = join_index.keys.get_indexer(left[left_on])
+	matched = positions >= 0
+	return {'left_rows': len(left),
+	        'lookup_rows': len(join_index.keys),
+	        'matched_left_rows': int(matched.sum()),
+	        'unmatched_left_rows': int((~matched).sum()),
+	        'match_rate': float(matched.mean()) if len(left) else float('nan'),
+	        'unused_lookup_rows': len(join_index.keys) - len(np.unique(positions[matched]))}
+
+@instrument
+def multi_merge(file_list, on, how='outer', suffixes=None):
+	'''merges many dataframes on a shared key column in a single alignment step,
+	   instead of re-hashing the growing result once per file as with reduce()
+
+	Args:
+		file_list: list of dataframes (or csv paths) that all contain column 'on'
+		on:        name of key column
+		how:       'outer' (keeps all keys, sorted) or 'inner' (keeps common keys)
+		suffixes:  optional list of suffixes, one per dataframe, added to columns
+		           found in more than one dataframe (default is '_0', '_1', ...)
+
+	Returns:
+		merged dataframe with one row per key
+	'''
+	if how not in ('outer', 'inner'):
+		raise ValueError("how must be 'outer' or 'inner'")
+	frames = []
+	for df in file_list:
+		if isinstance(df, str):
+			df = pd.read_csv(df)
+		df = df.set_index(on)
+		if not df.index.is_unique:
+			raise ValueError("key '{0}' is not unique within each file; use reduce/pd.merge".format(on))
+		frames.append(df)
+
+	## disambiguate repeated column names (pd.merge would add _x/_y)
+	counts = collections.Counter(col for df in frames for col in df.columns)
+	if suffixes is None:
+		suffixes = ['_{0}'.format(i) for i in range(len(frames))]
+	frames = [df.rename(columns=lambda col, suffix=suffix: '{0}{1}'.format(col, suffix) if counts[col] > 1 else col)
+	          for df, suffix in zip(frames, suffixes)]
+
+	merged = pd.concat(frames, axis=1, join=how, sort=(how == 'outer'))
+	merged.index.name = on
+	return merged.reset_index()
+
+@instrument
+def vertical_merge(inpath, outpath):
+	'''performs vertical merge of all .csvs in 'inpath' folder and writes to file
+
+	Args:
+		inpath:  path to csvs (all must have same columns)
+		outpath: path for merged file to be written
+
+	Returns:
+		a single csv containing all vertically stacked individual csvs, written to outpath
+	'''
+	import_list = glob.glob(inpath + '/*.csv')
+	file_list = [pd.read_csv(file) for file in import_list]
+	merged = pd.concat(file_list)
+	merged.to_csv(outpath, index=False)
+
+def _read_csv_file(args):
+	'''reads one csv for stream_vertical_merge (runs in a worker process)'''
+	path, dtype = args
+	return path, pd.read_csv(path, dtype=dtype)
+
+@instrument
+def stream_vertical_merge(inpath, outpath, output_format='csv', dtype=None,
+                          processes=None, max_pending=None):
+	'''performs vertical merge of all .csvs in 'inpath' folder, reading files in
+	   parallel and appending each to the output as it arrives, so only a few
+	   files are ever held in memory
+
+	Args:
+		inpath:  path to csvs (all must have same columns)
+		outpath: path for merged file to be written
+		output_format: 'csv' or 'parquet'
+		dtype: optional dtype dict passed to pd.read_csv (pins the schema); needed
+		       for parquet output when a column's type differs between files (e.g.
+		       ints in the first file, decimals in a later one), since the parquet
+		       schema is fixed by the first file and cannot be upcast afterwards
+		processes: number of reader processes (default is number of cpus)
+		max_pending: max number of files read ahead of the writer (default 2 * processes)
+
+	Returns:
+		number of rows written; files are appended in sorted filename order
+	'''
+	if output_format not in ('csv', 'parquet'):
+		raise ValueError("output_format must be 'csv' or 'parquet'")
+	import_list = sorted(glob.glob(inpath + '/*.csv'))
+	processes = processes or multiprocessing.cpu_count()
+	max_pending = max_pending or 2 * processes
+	files = iter(import_list)
+
+	pool = multiprocessing.Pool(processes)
+	pending = collections.deque()
+	columns, writer, nrows = None, None, 0
+	try:
+		for path in files:
+			pending.append(pool.apply_async(_read_csv_file, ((path, dtype),)))
+			if len(pending) >= max_pending:
+				break
+
+		while pending:
+			path, df = pending.popleft().get()
+			path_next = next(files, None)
+			if path_next is not None:
+				pending.append(pool.apply_async(_read_csv_file, ((path_next, dtype),)))
+
+			first = columns is None
+			if first:
+				columns = list(df.columns)
+			elif list(df.columns) != columns:
+				raise ValueError('columns of {0} do not match {1}'.format(path, import_list[0]))
+
+			if output_format == 'parquet':
+				table = pa.Table.from_pandas(df, preserve_index=False)
+				if writer is None:
+					writer = pq.ParquetWriter(outpath, table.schema)
+				elif not table.schema.equals(writer.schema):
+					try:
+						table = table.cast(writer.schema)
+					except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+						raise ValueError('column types of {0} do not match {1} ({2}); pass dtype '
+						                 'to fix them'.format(path, import_list[0], e))
+				writer.write_table(table)
+			else:
+				df.to_csv(outpath, mode='w' if first else 'a', header=first, index=False)
+			nrows += len(df)
+		pool.close()
+		pool.join()
+	finally:
+		pool.terminate()
+		if writer is not None:
+			writer.close()
+	return nrows
+
+
+#--------------------#
+#-- aggregate data --#
+#--------------------#
+def _partial_agg(args):
+	'''computes mergeable per-group statistics for one chunk (sub-function of chunked_groupby)'''
+	chunk, by, columns, sample_size = args
+	grouped = chunk.groupby(by, observed=True)[columns]
+	count = grouped.count()
+	state = {'count': count,
+	         'sum': grouped.sum(),
+	         'min': grouped.min(),
+	         'max': grouped.max(),
+	         'm2': grouped.var(ddof=0) * count}
+	if sample_size:
+		## bottom-k sample: the rows with the k smallest random keys are a
+		## uniform sample, and stay one after merging with another sample
+		sample = chunk[by + columns].copy()
+		sample['_key'] = np.random.RandomState().random_sample(len(sample))
+		state['sample'] = sample.sort_values('_key').groupby(by, observed=True).head(sample_size)
+	return state
+
+def _merge_agg(left, right, by, sample_size):
+	'''merges two sets of partial statistics (sub-function of chunked_groupby)'''
+	if left is None:
+		return right
+	levels = list(range(left['count'].index.nlevels))
+	state = {}
+	for stat, how in [('count', 'sum'), ('sum', 'sum'), ('min', 'min'), ('max', 'max')]:
+		state[stat] = pd.concat([left[stat], right[stat]]).groupby(level=levels).agg(how)
+
+	## parallel variance update: m2 = m2_a + m2_b + sum(n_i * (mean_i - mean)^2)
+	mean = state['sum'] / state['count']
+	m2 = state['count'] * 0.0
+	for part in (left, right):
+		part_mean = (part['sum'] / part['count']).reindex(mean.index)
+		spread = part['count'].reindex(mean.index) * (part_mean - mean) ** 2
+		m2 = m2 + part['m2'].reindex(mean.index).fillna(0) + spread.fillna(0)
+	state['m2'] = m2
+
+	if sample_size:
+		sample = pd.concat([left['sample'], right['sample']])
+		state['sample'] = sample.sort_values('_key').groupby(by, observed=True).head(sample_size)
+	return state
+
+@instrument
+def chunked_groupby(chunks, by, columns, quantiles=None, sample_size=10000, processes=None):
+	'''aggregates chunks of a dataframe by group with partial results per chunk
+
+	Args:
+		chunks:      iterable of dataframes (e.g. pd.read_csv(..., chunksize=100000))
+		by:          list of group columns
+		columns:     list of value columns to aggregate
+		quantiles:   optional list of quantiles (e.g. [0.5, 0.9]), approximated
+		             from a uniform random sample of up to 'sample_size' rows per group
+		sample_size: max sampled rows per group (only used for quantiles)
+		processes:   number of worker processes (default is None, i.e. no workers)
+
+	Returns:
+		dataframe indexed by group with (column, stat) columns for count, sum,
+		mean, min, max, var, std (ddof=1, as in pandas) and the quantiles
+	'''
+	by, columns = list(by), list(columns)
+	sample_size = sample_size if quantiles else 0
+	state = None
+	if processes is None:
+		for chunk in chunks:
+			state = _merge_agg(state, _partial_agg((chunk, by, columns, sample_size)), by, sample_size)
+	else:
+		pool = multiprocessing.Pool(processes)
+		pending = collections.deque()
+		try:
+			for chunk in chunks:
+				pending.append(pool.apply_async(_partial_agg, ((chunk, by, columns, sample_size),)))
+				if len(pending) >= 2 * processes:
+					state = _merge_agg(state, pending.popleft().get(), by, sample_size)
+			while pending:
+				state = _merge_agg(state, pending.popleft().get(), by, sample_size)
+			pool.close()
+			pool.join()
+		finally:
+			pool.terminate()
+	if state is None:
+		raise ValueError('no chunks to aggregate')
+
+	result = {'count': state['count'],
+	          'sum': state['sum'],
+	          'mean': state['sum'] / state['count'],
+	          'min': state['min'],
+	          'max': state['max'],
+	          ## pandas gives nan for groups with fewer than two values
+	          'var': (state['m2'] / (state['count'] - 1)).where(state['count'] >= 2)}
+	result['std'] = result['var'] ** 0.5
+	for q in quantiles or []:
+		result['q{0:g}'.format(q * 100)] = state['sample'].groupby(by, observed=True)[columns].quantile(q)
+	result = pd.concat(result, axis=1).swaplevel(axis=1)
+	return result[columns]
+
+
+#------------------#
+#-- reshape data --#
+#------------------#
+def _iter_chunks(inpath, chunksize, columns=None, dtype=None):
+	'''yields dataframe chunks of a csv or parquet file (sub-function of the reshape
+	   functions); dtype only applies to csv, parquet columns already have fixed types'''
+	if inpath.lower().endswith('.parquet'):
+		for batch in pq.ParquetFile(inpath).iter_batches(batch_size=chunksize, columns=columns):
+			yield batch.to_pandas()
+	else:
+		for chunk in pd.read_csv(inpath, usecols=columns, dtype=dtype, chunksize=chunksize):
+			yield chunk
+
+@instrument
+def stream_melt(inpath, outpath, id_vars, value_vars=None, var_name='variable',
+                value_name='value', chunksize=100000, dtype=None, value_dtype='float64'):
+	'''wide to long, one chunk at a time (melt works row by row, so chunks are independent)
+
+	Args:
+		inpath:     path to wide csv or parquet file
+		outpath:    path to output parquet file
+		id_vars:    list of identifier columns
+		value_vars: list of columns to unpivot (default is all other columns)
+		var_name:   name of the variable column
+		value_name: name of the value column
+		chunksize:  number of wide rows melted at a time
+		dtype:      dtype dict for reading a csv (default reads id_vars as str, so
+		            e.g. GEOID '01' keeps its leading zero in every chunk)
+		value_dtype: dtype of the value column, fixed so every chunk is written with
+		            the same schema (None keeps the type parsed from each chunk)
+
+	Returns:
+		number of long rows written
+	'''
+	columns = None if value_vars is None else list(id_vars) + list(value_vars)
+	if dtype is None:
+		dtype = dict.fromkeys(id_vars, str)
+	writer, nrows = None, 0
+	try:
+		for chunk in _iter_chunks(inpath, chunksize, columns, dtype=dtype):
+			long_df = pd.melt(chunk, id_vars=id_vars, value_vars=value_vars,
+			                  var_name=var_name, value_name=value_name)
+			if value_dtype is not None:
+				long_df[value_name] = long_df[value_name].astype(value_dtype)
+			table = pa.Table.from_pandas(long_df, preserve_index=False)
+			if writer is None:
+				writer = pq.ParquetWriter(outpath, table.schema)
+			else:
+				table = table.cast(writer.schema)
+			writer.write_table(table)
+			nrows += len(long_df)
+	finally:
+		if writer is not None:
+			writer.close()
+	return nrows
+
+@instrument
+def partitioned_pivot(inpath, outpath, index, columns, values, nbuckets=16,
+                      chunksize=1000000, tmpdir=None, index_dtype=str, value_dtype='float64'):
+	'''long to wide for large files: rows are split into buckets by a hash of the
+	   index columns (so each index value lands in exactly one bucket), and each
+	   bucket is pivoted on its own
+
+	Args:
+		inpath:    path to long csv or parquet file
+		outpath:   path to output parquet file
+		index:     list of index columns
+		columns:   column whose values become the new column names
+		values:    column holding the values
+		nbuckets:  number of buckets (each bucket must fit in memory)
+		chunksize: number of long rows read at a time
+		tmpdir:    folder for bucket files (default is the system temp folder)
+		index_dtype: dtype the index columns of a csv are read as; fixed so that
+		           every chunk hashes an index value the same way (e.g. 'int64'
+		           to keep integer ids as integers); the columns column of a csv
+		           is always read as str
+		value_dtype: dtype of the values column, fixed so every bucket is written
+		           with the same schema (None keeps the type parsed from each chunk)
+
+	Returns:
+		number of wide rows written (rows are ordered by index within each bucket)
+	'''
+	index = list(index)
+	bucket_dir = tempfile.mkdtemp(dir=tmpdir)
+	bucket_writers = {}
+	new_columns = set()
+	writer, nrows = None, 0
+	try:
+		## pass 1: split rows into buckets
+		dtype = dict.fromkeys(index, index_dtype)
+		dtype[columns] = str
+		for chunk in _iter_chunks(inpath, chunksize, index + [columns, values], dtype=dtype):
+			if value_dtype is not None:
+				chunk[values] = chunk[values].astype(value_dtype)
+			new_columns.update(chunk[columns].dropna().unique())
+			bucket = pd.util.hash_pandas_object(chunk[index], index=False).values % nbuckets
+			for i in np.unique(bucket):
+				table = pa.Table.from_pandas(chunk[bucket == i], preserve_index=False)
+				if i not in bucket_writers:
+					bucket_path = os.path.join(bucket_dir, '{0}.parquet'.format(i))
+					bucket_writers[i] = pq.ParquetWriter(bucket_path, table.schema)
+				else:
+					table = table.cast(bucket_writers[i].schema)
+				bucket_writers[i].write_table(table)
+		for bucket_writer in bucket_writers.values():
+			bucket_writer.close()
+
+		## pass 2: pivot each bucket, giving every bucket the same columns
+		new_columns = sorted(new_columns)
+		for i in sorted(bucket_writers):
+			long_df = pd.read_parquet(os.path.join(bucket_dir, '{0}.parquet'.format(i)))
+			wide = long_df.pivot(index=index, columns=columns, values=values)
+			wide = wide.reindex(columns=new_columns)
+			wide.columns = [str(col) for col in wide.columns]
+			wide = wide.reset_index()
+			table = pa.Table.from_pandas(wide, preserve_index=False)
+			if writer is None:
+				writer = pq.ParquetWriter(outpath, table.schema)
+			else:
+				table = table.cast(writer.schema)
+			writer.write_table(table)
+			nrows += len(wide)
+	finally:
+		for bucket_writer in bucket_writers.values():
+			bucket_writer.close()
+		if writer is not None:
+			writer.close()
+		shutil.rmtree(bucket_dir, ignore_errors=True)
+	return nrows
+
+
+#---------------------------#
+#-- duplicate/unique data --#
+#---------------------------#
+def _keep_mask(hashes, rows, keep):
+	'''row numbers kept by drop_duplicates semantics (sub-function of stream_drop_duplicates)'''
+	order = np.argsort(rows, kind='mergesort')
+	duplicated = pd.Series(hashes[order]).duplicated(keep=keep).values
+	return rows[order][~duplicated]
+
+@instrument
+def stream_drop_duplicates(inpath, outpath, subset, keep='first', chunksize=500000,
+                           max_memory=2 * 1024 ** 3, nbuckets=64, tmpdir=None, key_dtype=str):
+	'''writes a csv with duplicate rows removed, without loading the whole file
+
+	Args:
+		inpath:     path to input csv
+		outpath:    path to output csv
+		subset:     list of columns that identify duplicates
+		keep:       'first', 'last', or False (as in df.drop_duplicates)
+		chunksize:  number of rows read at a time
+		max_memory: bytes of key hashes held in memory before spilling to disk
+		nbuckets:   number of spill files (each must fit in memory on its own)
+		tmpdir:     folder for spill files (default is the system temp folder)
+		key_dtype:  dtype the subset columns are read (and compared) as; fixed so
+		            that every chunk hashes a key the same way (with str, '1' and
+		            '1.0' are different keys)
+
+	Returns:
+		number of rows written
+	'''
+	## pass 1: hash the key columns of every row
+	hashes, rows, nbytes, nrows = [], [], 0, 0
+	spill_dir, spill_files = None, None
+	try:
+		for chunk in pd.read_csv(inpath, usecols=subset, dtype=dict.fromkeys(subset, key_dtype),
+		                         chunksize=chunksize):
+			h = pd.util.hash_pandas_object(chunk[subset], index=False).values
+			r = np.arange(nrows, nrows + len(chunk), dtype=np.int64)
+			nrows += len(chunk)
+			if spill_files is None:
+				hashes.append(h)
+				rows.append(r)
+				nbytes += h.nbytes + r.nbytes
+				if nbytes > max_memory:
+					spill_dir = tempfile.mkdtemp(dir=tmpdir)
+					spill_files = [open(os.path.join(spill_dir, '{0}.bin'.format(i)), 'wb')
+					               for i in range(nbuckets)]
+					h, r = np.concatenate(hashes), np.concatenate(rows)
+					hashes, rows = [], []
+			if spill_files is not None:
+				bucket = h % nbuckets
+				for i in np.unique(bucket):
+					in_bucket = bucket == i
+					pairs = np.empty((in_bucket.sum(), 2), dtype=np.uint64)
+					pairs[:, 0] = h[in_bucket]
+					pairs[:, 1] = r[in_bucket]
+					spill_files[i].write(pairs.tobytes())
+
+		## decide which row numbers survive
+		keep_rows = np.zeros(nrows, dtype=bool)
+		if spill_files is None:
+			if nrows:
+				keep_rows[_keep_mask(np.concatenate(hashes), np.concatenate(rows), keep)] = True
+		else:
+			for f in spill_files:
+				f.close()
+				pairs = np.fromfile(f.name, dtype=np.uint64).reshape(-1, 2)
+				keep_rows[_keep_mask(pairs[:, 0], pairs[:, 1].astype(np.int64), keep)] = True
+	finally:
+		if spill_dir is not None:
+			for f in spill_files:
+				f.close()
+			shutil.rmtree(spill_dir, ignore_errors=True)
+	del hashes, rows
+
+	## pass 2: copy the surviving rows, read as text so values are written
+	## back as they were (e.g. '007' stays '007' and 'NA' stays 'NA')
+	start, written = 0, 0
+	for chunk in pd.read_csv(inpath, dtype=str, keep_default_na=False, chunksize=chunksize):
+		out = chunk[keep_rows[start:start + len(chunk)]]
+		out.to_csv(outpath, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+		start += len(chunk)
+		written += len(out)
+	return written
+
+
+#-----------------------#
+#-- convert data type --#
+#-----------------------#
+def infer_schema(inpath, nrows=100000, max_category_ratio=0.5, downcast_floats=True):
+	'''infers compact dtypes from the first rows of a csv
+
+	Args:
+		inpath:             path to csv
+		nrows:              number of rows to sample
+		max_category_ratio: text columns with (unique values / rows) at or below this become categoricals
+		downcast_floats:    store floats as float32 (False keeps float64)
+
+	Returns:
+		schema dictionary with 'dtype' and 'parse_dates' entries (pd.read_csv arguments)
+	'''
+	sample = pd.read_csv(inpath, nrows=nrows)
+	dtype, parse_dates = {}, []
+	for col in sample.columns:
+		values = sample[col]
+		if pd.api.types.is_bool_dtype(values):
+			dtype[col] = 'bool'
+		elif pd.api.types.is_integer_dtype(values):
+			dtype[col] = str(pd.to_numeric(values, downcast='integer').dtype)
+		elif pd.api.types.is_float_dtype(values):
+			dtype[col] = 'float32' if downcast_floats else 'float64'
+		elif values.notnull().any():
+			as_dates = pd.to_datetime(values, errors='coerce')
+			if as_dates.notnull().sum() == values.notnull().sum():
+				parse_dates.append(col)
+			elif values.nunique() <= max_category_ratio * values.notnull().sum():
+				dtype[col] = 'category'
+	return {'dtype': dtype, 'parse_dates': parse_dates}
+
+def _downcast_ints(chunk, int_dtypes):
+	'''casts the (nullable Int64) int columns of a chunk to their schema dtype, or to the
+	   smallest dtype that holds values outside the sampled range; columns with missing
+	   values get the nullable version of that dtype (sub-function of read_csv_with_schema)
+
+	Returns:
+		chunk, and set of columns that had missing values
+	'''
+	nullable = set()
+	for col, col_dtype in int_dtypes.items():
+		values = chunk[col]
+		present = values.dropna()
+		info = np.iinfo(col_dtype.lower())
+		if len(present) and (present.min() < info.min or present.max() > info.max):
+			col_dtype = str(pd.to_numeric(present.astype('int64'), downcast='integer').dtype)
+		if col_dtype.startswith('Int') or values.isna().any():
+			nullable.add(col)
+			chunk[col] = values.astype(col_dtype.capitalize())
+		else:
+			chunk[col] = values.astype(col_dtype)
+	return chunk, nullable
+
+def _read_int_chunks(inpath, dtype, parse_dates, int_dtypes, chunksize, kwargs):
+	'''reads a csv in chunks, downcasting the int columns of each chunk as it is
+	   read (sub-function of read_csv_with_schema)
+
+	Returns:
+		list of chunks, and set of int columns that had missing values
+	'''
+	chunks, nullable = [], set()
+	for chunk in pd.read_csv(inpath, dtype=dtype, parse_dates=parse_dates,
+	                         chunksize=chunksize, **kwargs):
+		chunk, chunk_nullable = _downcast_ints(chunk, int_dtypes)
+		chunks.append(chunk)
+		nullable |= chunk_nullable
+	return chunks, nullable
+
+def _decimal_columns(inpath, int_dtypes, chunksize, kwargs):
+	'''int columns of the schema that hold decimals beyond the sampled rows
+	   (sub-function of read_csv_with_schema)
+
+	Returns:
+		set of column names
+	'''
+	kwargs = dict((k, v) for k, v in kwargs.items() if k != 'usecols')
+	decimals = set()
+	for chunk in pd.read_csv(inpath, usecols=list(int_dtypes), dtype='float64',
+	                         chunksize=chunksize, **kwargs):
+		for col in chunk.columns:
+			if (chunk[col].dropna() % 1 != 0).any():
+				decimals.add(col)
+	return decimals
+
+@instrument
+def read_csv_with_schema(inpath, schema_path=None, refresh=False, chunksize=500000, **kwargs):
+	'''reads a csv with a cached compact schema, inferring it on first use
+	   (re-inferred whenever the file's size or modification time changes)
+
+	Args:
+		inpath:      path to csv
+		schema_path: path of the cached schema (default is inpath + '.schema.json')
+		refresh:     re-infer the schema even if a cached one is valid
+		chunksize:   number of rows parsed at a time; ints are parsed as nullable Int64 and
+		             downcast per chunk, so values outside the sample never overflow, and
+		             only columns with missing values stay nullable (int columns with
+		             decimals outside the sample are read as float64)
+		**kwargs:    passed on to pd.read_csv (e.g. usecols)
+
+	Returns:
+		dataframe
+	'''
+	schema_path = schema_path or inpath + '.schema.json'
+	stat = os.stat(inpath)
+	source = {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+	schema = None
+	if not refresh and os.path.exists(schema_path):
+		with open(schema_path) as f:
+			cached = json.load(f)
+		if cached.get('source') == source:
+			schema = cached
+	if schema is None:
+		schema = infer_schema(inpath)
+		schema['source'] = source
+		with open(schema_path, 'w') as f:
+			json.dump(schema, f, indent=2)
+
+	usecols = kwargs.get('usecols')
+	dtype = dict((col, t) for col, t in schema['dtype'].items() if usecols is None or col in usecols)
+	parse_dates = [col for col in schema['parse_dates'] if usecols is None or col in usecols]
+	int_dtypes = dict((col, t) for col, t in dtype.items() if t.lower().startswith('int'))
+	dtype.update(dict.fromkeys(int_dtypes, 'Int64'))
+	changed = False
+	try:
+		chunks, nullable = _read_int_chunks(inpath, dtype, parse_dates, int_dtypes, chunksize, kwargs)
+	except (TypeError, ValueError):
+		## int columns with decimals beyond the sampled rows: store them as
+		## floats, here and in the cached schema
+		decimals = _decimal_columns(inpath, int_dtypes, chunksize, kwargs) if int_dtypes else set()
+		if not decimals:
+			raise
+		for col in decimals:
+			schema['dtype'][col] = dtype[col] = 'float64'
+			del int_dtypes[col]
+		changed = True
+		chunks, nullable = _read_int_chunks(inpath, dtype, parse_dates, int_dtypes, chunksize, kwargs)
+
+	## int columns with missing values beyond the sampled rows: make only those
+	## columns nullable, in every chunk and in the cached schema
+	for col in nullable:
+		for chunk in chunks:
+			chunk[col] = chunk[col].astype(str(chunk[col].dtype).capitalize())
+		if schema['dtype'][col].startswith('int'):
+			schema['dtype'][col] = schema['dtype'][col].capitalize()
+			changed = True
+	if changed:
+		with open(schema_path, 'w') as f:
+			json.dump(schema, f, indent=2)
+
+	## give each categorical column the same categories in every chunk, so
+	## concat keeps it categorical
+	for col in [col for col, t in dtype.items() if t == 'category']:
+		categories = pd.api.types.union_categoricals([chunk[col] for chunk in chunks]).categories
+		for chunk in chunks:
+			chunk[col] = chunk[col].cat.set_categories(categories)
+	return pd.concat(chunks, ignore_index=True)
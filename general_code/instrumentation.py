@@ -0,0 +1,201 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## opt-in timing and i/o accounting for the helper functions. Decorate a
+## function with @instrument (or wrap a block in profile_section) and, once
+## enabled, every call records wall time, bytes read/written, and memory
+## allocated (numpy/pandas allocations are seen by tracemalloc). When
+## disabled, the only cost is one flag check per call.
+##
+##   from general_code import instrumentation
+##   instrumentation.enable(trace_memory=True)    # or set GENERAL_CODE_PROFILE=1
+##   ... run the pipeline ...
+##   instrumentation.summary()                    # dataframe of per-function totals
+##   instrumentation.write_trace('trace.json')    # open in chrome://tracing or perfetto
+##
+## bytes read/written come from /proc/self/io (linux only; None elsewhere)
+## and include everything the process read or wrote during the call.
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+#----------------------#
+#-- define functions --#
+#----------------------#
+_state = {'enabled': os.environ.get('GENERAL_CODE_PROFILE', '') not in ('', '0'),
+          'trace_memory': False}
+_stats = {}
+_events = collections.deque(maxlen=100000)   # most recent calls, for write_trace
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable(trace_memory=False, max_events=100000):
+    '''Turns on recording for all instrumented functions
+
+    Args:
+        trace_memory:  also record memory allocated per call (slows python code down)
+        max_events:  number of most recent calls kept for write_trace (0 to keep
+            none, e.g. for long production runs; None for no limit)
+    '''
+    global _events
+    with _lock:
+        if max_events != _events.maxlen:
+            _events = collections.deque(_events, maxlen=max_events)
+    _state['enabled'] = True
+    _state['trace_memory'] = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable():
+    '''Turns off recording (collected statistics are kept until reset)'''
+    _state['enabled'] = False
+    if _state['trace_memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _state['trace_memory'] = False
+
+def reset():
+    '''Clears collected statistics and trace events'''
+    with _lock:
+        _stats.clear()
+        _events.clear()
+
+def _io_counters():
+    '''Bytes read and written by this process so far, or None if unavailable'''
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+def _record(name, start, seconds, io_start, io_end, alloc_bytes):
+    '''Adds one call to the statistics and the trace (sub-function of profile_section)'''
+    read = written = None
+    if io_start is not None and io_end is not None:
+        read, written = io_end[0] - io_start[0], io_end[1] - io_start[1]
+    with _lock:
+        stats = _stats.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                         'bytes_read': 0, 'bytes_written': 0, 'alloc_bytes': 0})
+        stats['calls'] += 1
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        if read is not None:
+            stats['bytes_read'] += read
+            stats['bytes_written'] += written
+        if alloc_bytes is not None:
+            stats['alloc_bytes'] += alloc_bytes
+        if _events.maxlen != 0:
+            _events.append({'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': seconds * 1e6,
+                            'pid': os.getpid(), 'tid': threading.current_thread().ident,
+                            'args': {'bytes_read': read, 'bytes_written': written,
+                                     'alloc_bytes': alloc_bytes}})
+
+@contextlib.contextmanager
+def profile_section(name):
+    '''Records a block of code under 'name' (does nothing when disabled)
+
+    Args:
+        name:  label for the block in the summary and trace
+    '''
+    if not _state['enabled']:
+        yield
+        return
+
+    ## /proc/self/io is read outside the memory tracking, so its buffer is not
+    ## counted as the call's allocation
+    io_start = _io_counters()
+
+    ## memory: peak allocations during this call, above what was allocated at
+    ## entry. Nested calls reset tracemalloc's peak, so each frame keeps the
+    ## highest peak seen by the calls it contains.
+    trace_memory = _state['trace_memory'] and tracemalloc.is_tracing()
+    stack = _local.__dict__.setdefault('stack', [])
+    frame = None
+    if trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        frame = {'start': current, 'peak': current}
+        stack.append(frame)
+        tracemalloc.reset_peak()
+        ## baseline after the bookkeeping above, so it is not charged to the call
+        frame['start'] = frame['peak'] = tracemalloc.get_traced_memory()[0]
+
+    start = time.time()
+    timer = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - timer
+        alloc_bytes = None
+        if frame is not None:
+            stack.pop()
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            alloc_bytes = peak - frame['start']
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        io_end = _io_counters()
+        _record(name, start, seconds, io_start, io_end, alloc_bytes)
+
+def instrument(func=None, name=None):
+    '''Decorator that records every call of a function while recording is enabled
+
+    Args:
+        func:  function to wrap (when used as @instrument)
+        name:  optional label (default is the function's name)
+
+    Returns:
+        Wrapped function
+    '''
+    if func is None:
+        return functools.partial(instrument, name=name)
+    label = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _state['enabled']:
+            return func(*args, **kwargs)
+        with profile_section(label):
+            return func(*args, **kwargs)
+    return wrapper
+
+def summary():
+    '''Per-function totals, sorted by total time
+
+    Returns:
+        Dataframe with calls, seconds, mean/max seconds, MB read/written, and MB allocated
+    '''
+    import pandas as pd
+    with _lock:
+        rows = dict((name, dict(stats)) for name, stats in _stats.items())
+    df = pd.DataFrame.from_dict(rows, orient='index',
+                                columns=['calls', 'seconds', 'max_seconds', 'bytes_read',
+                                         'bytes_written', 'alloc_bytes'])
+    df['mean_seconds'] = df['seconds'] / df['calls']
+    for col in ['bytes_read', 'bytes_written', 'alloc_bytes']:
+        df[col.replace('bytes', 'mb')] = df.pop(col) / 1024.0 ** 2
+    return df.sort_values('seconds', ascending=False)
+
+def write_trace(outpath):
+    '''Writes the most recent recorded calls (see enable's max_events) as a
+       chrome trace-event json file
+
+    Args:
+        outpath:  output file path (e.g. 'path/to/trace.json')
+    '''
+    with _lock:
+        events = list(_events)
+    with open(outpath, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
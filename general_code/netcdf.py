@@ -0,0 +1,375 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## netcdf query helpers from Python_netcdf_basics.py. The script versions
+## read the lats/lons/dates/data globals; here they are passed in as a
+## Cube, and open_cube leaves 'data' on disk so a query only reads the
+## cells it needs. netCDF4, numpy, and pandas are imported on first use.
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import collections
+import multiprocessing
+import os
+
+from ._lazy import LazyModule
+from .instrumentation import instrument
+
+netCDF4 = LazyModule('netCDF4')
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+
+#----------------------#
+#-- define functions --#
+#----------------------#
+## lats, lons:  coordinate axes (decimal degrees)
+## dates:  time axis in YYYYMMDD format
+## data:  (time, latitude, longitude) array, or the netcdf variable itself
+Cube = collections.namedtuple('Cube', ['lats', 'lons', 'dates', 'data'])
+
+## same axes, with data stored pixel-major as a (latitude, longitude, time)
+## memory-mapped .npy file, so one point's series is one contiguous read
+PointStore = collections.namedtuple('PointStore', ['lats', 'lons', 'dates', 'data'])
+
+
+def open_cube(filepath):
+    '''Opens a netcdf without reading its data array
+
+    Args:
+        filepath:  path to netcdf (e.g. 'path/to/netcdf_file.nc')
+
+    Returns:
+        Cube whose 'data' is the netcdf variable (read on slicing)
+    '''
+    nc = netCDF4.Dataset(filepath, 'r')
+    variables = nc.variables
+    return Cube(lats=variables['latitude'][:],
+                lons=variables['longitude'][:],
+                dates=variables['time'][:],
+                data=variables['data'])
+
+def find_nearest(coordinate, coordinate_matrix):
+    '''Finds index of nearest value in array (sub-function of other functions)
+
+    Args:
+        coordinate:  individual coordinate (lat or lon)
+        coordinate_matrix:  matrix of coordinates to search for nearest value
+
+    Returns:
+        Index of nearest value
+    '''
+    idx = (np.abs(coordinate_matrix - coordinate)).argmin()
+    return idx
+
+def date_range(dates, start_date=None, end_date=None):
+    '''Finds the slice of the time axis between two dates (sub-function of other functions)
+
+    Args:
+        dates:  sorted time axis (YYYYMMDD)
+        start_date:  first date of time slice (YYYYMMDD; None for no lower bound)
+        end_date:  last date of time slice (YYYYMMDD; None for no upper bound)
+
+    Returns:
+        Slice of time indices
+    '''
+    keep = np.ones(len(dates), dtype=bool)
+    if start_date is not None:
+        keep &= dates >= start_date
+    if end_date is not None:
+        keep &= dates <= end_date
+    indices = np.flatnonzero(keep)
+    if len(indices) == 0:
+        return slice(0, 0)
+    return slice(int(indices[0]), int(indices[-1]) + 1)
+
+def point_series(latitude, longitude, cube, start_date=None, end_date=None):
+    '''Reads the time series of the grid cell nearest to a point
+
+    Args:
+        latitude:  latitude of interest
+        longitude:  longitude of interest
+        cube:  Cube (from open_cube) or PointStore (from open_point_store)
+        start_date, end_date:  optional date range (YYYYMMDD)
+
+    Returns:
+        Tuple of (dates, values) arrays; from a PointStore, values is a
+        read-only view of the memory-mapped file (no copy)
+    '''
+    lat_idx = find_nearest(latitude, cube.lats)
+    lon_idx = find_nearest(longitude, cube.lons)
+    times = date_range(cube.dates, start_date, end_date)
+    if isinstance(cube, PointStore):
+        return cube.dates[times], cube.data[lat_idx, lon_idx, times]
+    return cube.dates[times], cube.data[times, lat_idx, lon_idx]
+
+@instrument
+def point_slice(latitude, longitude, cube):
+    '''Creates time series of temperatures from single set of coordinates
+
+    Args:
+        latitude:  latitude of interest
+        longitude:  longitude of interest
+        cube:  Cube (from open_cube) or PointStore (from open_point_store)
+
+    Returns:
+        Dataframe containing time series of temperatures
+    '''
+    dates, values = point_series(latitude, longitude, cube)
+    result = pd.DataFrame({'values': values, 'dates': dates})
+    return result
+
+@instrument
+def time_slice(start_date, end_date, cube):
+    '''Creates statewide temperature grid from specified dates(s)
+
+    Args:
+        start_date:  first date of time slice (YYYYMMDD)
+        end_date:  last date of time slice (YYYYMMDD)
+        cube:  Cube (from open_cube)
+
+    Returns:
+        Array of temperatures
+    '''
+    values = cube.data[date_range(cube.dates, start_date, end_date), :, :]
+    return values
+
+@instrument
+def point_time_slice(latitude, longitude, start_date, end_date, cube):
+    '''Creates time series of temperatures from a single specified set of
+       coordinates and dates
+
+    Args:
+        latitude:  latitude of interest
+        longitude:  longitude of interest
+        start_date:  first date of time slice (YYYYMMDD)
+        end_date:  last date of time slice (YYYYMMDD)
+        cube:  Cube (from open_cube) or PointStore (from open_point_store)
+
+    Returns:
+        Dataframe of temperatures
+    '''
+    dates, values = point_series(latitude, longitude, cube, start_date, end_date)
+    result = pd.DataFrame({'values': values, 'dates': dates})
+    return result
+
+@instrument
+def make_ncdf(outpath, data_slice, cube, start_date=None, end_date=None):
+    '''Creates netcdf from data slices
+
+    Args:
+        outpath:  output file path (e.g. 'path/to/outfile.nc')
+        data_slice:  time slice of array (from 'time_slice' function)
+        cube:  Cube the slice was taken from (for the lat/lon/time axes)
+        start_date, end_date:  date range of the slice (default is all dates)
+    '''
+    date_slice = cube.dates[date_range(cube.dates, start_date, end_date)]
+    nc_new = netCDF4.Dataset(outpath, 'w', format='NETCDF4_CLASSIC')
+    try:
+        nc_new.createDimension('longitude', len(cube.lons))
+        nc_new.createDimension('latitude',  len(cube.lats))
+        nc_new.createDimension('time', len(date_slice))
+        nc_new.createVariable('longitude', np.float32, ('longitude',))
+        nc_new.createVariable('latitude',  np.float32, ('latitude',))
+        nc_new.createVariable('time',      np.int32,   ('time',))
+        nc_new.createVariable('data',      np.float32, ('time', 'latitude', 'longitude'))
+        nc_new.variables['latitude'][:]  = cube.lats
+        nc_new.variables['longitude'][:] = cube.lons
+        nc_new.variables['time'][:]      = date_slice
+        nc_new.variables['data'][:]      = data_slice
+    finally:
+        # remove file from memory
+        nc_new.close()
+
+@instrument
+def export_point_store(cube, outdir, block_rows=8):
+    '''Writes the cube's data transposed to pixel-major order, for fast point
+       reads (one-time export; missing values are stored as nan)
+
+    Args:
+        cube:  Cube (from open_cube)
+        outdir:  output folder (holds data.npy, lats.npy, lons.npy, dates.npy)
+        block_rows:  number of latitude rows transposed at a time
+
+    Returns:
+        PointStore opened from outdir
+    '''
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    ntime, nlat, nlon = cube.data.shape
+    store = np.lib.format.open_memmap(os.path.join(outdir, 'data.npy'), mode='w+',
+                                      dtype=np.float32, shape=(nlat, nlon, ntime))
+    for row in range(0, nlat, block_rows):
+        block = np.ma.filled(cube.data[:, row:row + block_rows, :], np.nan)
+        store[row:row + block_rows] = block.astype(np.float32).transpose(1, 2, 0)
+    store.flush()
+    del store
+
+    np.save(os.path.join(outdir, 'lats.npy'), np.ma.filled(cube.lats, np.nan))
+    np.save(os.path.join(outdir, 'lons.npy'), np.ma.filled(cube.lons, np.nan))
+    np.save(os.path.join(outdir, 'dates.npy'), np.ma.filled(cube.dates, 0))
+    return open_point_store(outdir)
+
+def open_point_store(storedir):
+    '''Opens a point store written by export_point_store (data is memory-mapped)
+
+    Args:
+        storedir:  folder written by export_point_store
+
+    Returns:
+        PointStore
+    '''
+    return PointStore(lats=np.load(os.path.join(storedir, 'lats.npy')),
+                      lons=np.load(os.path.join(storedir, 'lons.npy')),
+                      dates=np.load(os.path.join(storedir, 'dates.npy')),
+                      data=np.load(os.path.join(storedir, 'data.npy'), mmap_mode='r'))
+
+## per-cell (latitude, longitude) summaries from detect_events
+Events = collections.namedtuple('Events', ['threshold', 'count', 'longest', 'days'])
+
+def _rolling_mean(values, window):
+    '''Trailing rolling mean along the time axis via a cumulative sum; windows
+       with any missing day are nan (sub-function of detect_events)
+
+    Args:
+        values:  (time, cells) array with nan for missing values
+        window:  number of days in the window
+
+    Returns:
+        Array of the same shape
+    '''
+    valid = np.isfinite(values)
+    sums = np.zeros((values.shape[0] + 1,) + values.shape[1:])
+    counts = np.zeros((values.shape[0] + 1,) + values.shape[1:], dtype=np.int32)
+    np.cumsum(np.where(valid, values, 0), axis=0, out=sums[1:])
+    np.cumsum(valid, axis=0, out=counts[1:])
+    means = np.full(values.shape, np.nan)
+    full = (counts[window:] - counts[:-window]) == window
+    means[window - 1:][full] = ((sums[window:] - sums[:-window]) / window)[full]
+    return means
+
+def _run_lengths(flags):
+    '''Number of consecutive True values ending at each time step (sub-function
+       of detect_events)
+
+    Args:
+        flags:  (time, cells) boolean array
+
+    Returns:
+        Integer array of the same shape
+    '''
+    totals = np.cumsum(flags, axis=0, dtype=np.int32)
+    ## total at the last False before each step, carried forward
+    resets = np.maximum.accumulate(np.where(flags, 0, totals), axis=0)
+    return totals - resets
+
+def _block_events(task):
+    '''Detects events in one block of latitude rows (sub-function of detect_events)
+
+    Args:
+        task:  tuple of (row, block, window, percentile, min_days, below)
+
+    Returns:
+        Tuple of (row, threshold, count, longest, days, lengths)
+    '''
+    row, block, window, percentile, min_days, below = task
+    ntime, nrows, ncols = block.shape
+    means = _rolling_mean(block.reshape(ntime, -1), window)
+    with np.errstate(invalid='ignore'):
+        threshold = np.nanpercentile(means, percentile, axis=0)
+        flags = means < threshold if below else means > threshold
+
+    ## length of the run each day belongs to = run so far + run remaining - 1
+    lengths = _run_lengths(flags) + _run_lengths(flags[::-1])[::-1] - 1
+    lengths[~flags] = 0
+    lengths[lengths < min_days] = 0
+    ends = lengths > 0
+    ends[:-1] &= ~flags[1:]
+
+    count = ends.sum(axis=0)
+    longest = lengths.max(axis=0)
+    days = (lengths > 0).sum(axis=0)
+    shape = (nrows, ncols)
+    return (row, threshold.reshape(shape), count.reshape(shape), longest.reshape(shape),
+            days.reshape(shape), lengths.reshape(ntime, nrows, ncols).astype(np.float32))
+
+@instrument
+def detect_events(cube, window=3, percentile=95, min_days=3, below=False,
+                  start_date=None, end_date=None, outpath=None, block_rows=8,
+                  processes=None):
+    '''Finds threshold events (e.g. heat waves or cold spells) in every grid
+       cell: runs of at least min_days days whose rolling mean is beyond the
+       cell's own percentile threshold
+
+    Args:
+        cube:  Cube (from open_cube)
+        window:  days in the trailing rolling mean (1 for daily values)
+        percentile:  per-cell threshold percentile of the rolling means in the
+            date range (0-100)
+        min_days:  minimum number of consecutive days for an event
+        below:  True for events below the threshold (e.g. cold spells with a
+            low percentile)
+        start_date, end_date:  optional date range (YYYYMMDD)
+        outpath:  optional netcdf path for the daily result (length of the event
+            each day belongs to, 0 outside events), written with make_ncdf
+        block_rows:  number of latitude rows per block
+        processes:  number of worker processes (default is number of cpus;
+            1 to run in this process)
+
+    Returns:
+        Events of (latitude, longitude) arrays: threshold, number of events,
+        longest event (days), and total event days (nan thresholds and zeros
+        if no dates fall in the range; outpath is then not written)
+    '''
+    times = date_range(cube.dates, start_date, end_date)
+    ntime = len(cube.dates[times])
+    nlat, nlon = len(cube.lats), len(cube.lons)
+    threshold = np.full((nlat, nlon), np.nan)
+    count = np.zeros((nlat, nlon), dtype=np.int32)
+    longest = np.zeros((nlat, nlon), dtype=np.int32)
+    days = np.zeros((nlat, nlon), dtype=np.int32)
+    if ntime == 0:
+        ## no dates in the range: no thresholds or events, and no netcdf to write
+        return Events(threshold=threshold, count=count, longest=longest, days=days)
+    lengths = np.zeros((ntime, nlat, nlon), dtype=np.float32) if outpath else None
+
+    def blocks():
+        for row in range(0, nlat, block_rows):
+            block = np.ma.filled(cube.data[times, row:row + block_rows, :].astype(float), np.nan)
+            yield (row, block, window, percentile, min_days, below)
+
+    def collect(result):
+        row, block_threshold, block_count, block_longest, block_days, block_lengths = result
+        rows = slice(row, row + block_threshold.shape[0])
+        threshold[rows], count[rows], longest[rows], days[rows] = \
+            block_threshold, block_count, block_longest, block_days
+        if lengths is not None:
+            lengths[:, rows, :] = block_lengths
+
+    if processes == 1:
+        for task in blocks():
+            collect(_block_events(task))
+    else:
+        ## read blocks in this process while the workers compute, keeping at
+        ## most max_pending blocks in flight
+        processes = processes or multiprocessing.cpu_count()
+        max_pending = 2 * processes
+        pool = multiprocessing.Pool(processes)
+        pending = collections.deque()
+        try:
+            for task in blocks():
+                pending.append(pool.apply_async(_block_events, (task,)))
+                if len(pending) >= max_pending:
+                    collect(pending.popleft().get())
+            while pending:
+                collect(pending.popleft().get())
+            pool.close()
+            pool.join()
+        finally:
+            pool.terminate()
+
+    if outpath:
+        make_ncdf(outpath, lengths, cube, start_date, end_date)
+    return Events(threshold=threshold, count=count, longest=longest, days=days)
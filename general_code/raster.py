@@ -0,0 +1,117 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## raster helpers from basic_raster_commands.py: reading at display
+## resolution and drawing many frames onto a map. gdal and matplotlib are
+## imported the first time a function uses them.
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+from ._lazy import LazyModule
+from .instrumentation import instrument
+
+gdal = LazyModule('osgeo.gdal')
+np = LazyModule('numpy')
+plt = LazyModule('matplotlib.pyplot')
+
+
+#-------------------------------------------------------#
+#-- plot many frames (e.g. daily maps) at display res --#
+#-------------------------------------------------------#
+@instrument
+def read_display_array(ds, max_size=800, band=1):
+    '''Reads a raster band downsampled to display resolution
+
+    Args:
+        ds:  gdal dataset
+        max_size:  max number of pixels along the longest side
+        band:  band number
+
+    Returns:
+        Array of values (nodata set to nan), and geotransform of that array
+    '''
+    xsize, ysize = ds.RasterXSize, ds.RasterYSize
+    scale = max(1.0, max(xsize, ysize) / float(max_size))
+    buf_x = max(1, int(round(xsize / scale)))
+    buf_y = max(1, int(round(ysize / scale)))
+
+    rb = ds.GetRasterBand(band)
+    data = rb.ReadAsArray(0, 0, xsize, ysize,
+                          buf_xsize=buf_x, buf_ysize=buf_y,
+                          resample_alg=gdal.GRIORA_Average).astype(np.float32)
+    nodata = rb.GetNoDataValue()
+    if nodata is not None:
+        data[data == nodata] = np.nan
+
+    gt = ds.GetGeoTransform()
+    gt = (gt[0], gt[1] * xsize / float(buf_x), gt[2],
+          gt[3], gt[4], gt[5] * ysize / float(buf_y))
+    return data, gt
+
+def map_lookup(m, gt, shape, nx=800, ny=600):
+    '''Finds the source pixel for each cell of a regular grid in map projection
+       coordinates (computed once, reused for every frame)
+
+    Args:
+        m:  Basemap instance
+        gt:  geotransform of the frames (lon/lat)
+        shape:  (nrows, ncols) of the frames
+        nx, ny:  size of the output image in pixels
+
+    Returns:
+        Tuple of (row indices, column indices, mask of cells outside the raster)
+    '''
+    lons, lats = m.makegrid(nx, ny)
+    cols = np.floor((lons - gt[0]) / gt[1]).astype(int)
+    rows = np.floor((lats - gt[3]) / gt[5]).astype(int)
+    outside = (rows < 0) | (rows >= shape[0]) | (cols < 0) | (cols >= shape[1])
+    rows = np.clip(rows, 0, shape[0] - 1)
+    cols = np.clip(cols, 0, shape[1] - 1)
+    return rows, cols, outside
+
+def project_frame(frame, lookup):
+    '''Resamples one frame onto the map grid (sub-function of render_frames)
+
+    Args:
+        frame:  2d array with the geotransform used to build 'lookup'
+        lookup:  output of map_lookup
+
+    Returns:
+        Masked array in map projection coordinates
+    '''
+    rows, cols, outside = lookup
+    z = frame[rows, cols]
+    return np.ma.masked_array(z, mask=outside | np.isnan(z))
+
+@instrument
+def render_frames(frames, m, lookup, outpaths, titles=None, vmin=None,
+                  vmax=None, cmap='viridis'):
+    '''Draws each frame into the same image artist and writes it to file
+
+    Args:
+        frames:  iterable of 2d arrays (same grid as 'lookup')
+        m:  Basemap instance with boundaries etc. already drawn
+        lookup:  output of map_lookup
+        outpaths:  list of output image paths, one per frame
+        titles:  optional list of titles, one per frame
+        vmin, vmax:  fixed color limits (keep constant for animations)
+        cmap:  matplotlib colormap name
+
+    Returns:
+        List of written file paths
+    '''
+    fig = plt.gcf()
+    im = None
+    for i, (frame, outpath) in enumerate(zip(frames, outpaths)):
+        z = project_frame(frame, lookup)
+        if im is None:
+            im = m.imshow(z, cmap=cmap, vmin=vmin, vmax=vmax, interpolation='nearest')
+            m.colorbar(im, location='bottom', pad='10%')
+        else:
+            im.set_data(z)
+        if titles is not None:
+            plt.title(titles[i])
+        fig.savefig(outpath)
+    return list(outpaths)
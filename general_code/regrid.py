@@ -0,0 +1,240 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## regridding the NetCDF cube onto raster grids (e.g. a projected GeoTIFF)
+## without writing a GeoTIFF per date and running gdalwarp on each. The
+## weights between the cube's lat/lon cells and the target pixels are
+## computed once, cached on disk as a sparse matrix, and applied to many
+## dates at a time with one sparse matrix multiply. gdal/osr, numpy, and
+## scipy are imported on first use.
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import collections
+import hashlib
+import os
+
+from ._lazy import LazyModule
+from .instrumentation import instrument
+from .netcdf import date_range
+
+gdal = LazyModule('osgeo.gdal')
+np = LazyModule('numpy')
+osr = LazyModule('osgeo.osr')
+sparse = LazyModule('scipy.sparse')
+
+
+#----------------------#
+#-- define functions --#
+#----------------------#
+## weights:  (target pixels, cube cells) sparse matrix
+## geotransform, projection:  target grid (projection None for lat/lon)
+## shape:  (rows, cols) of the target grid
+Regridder = collections.namedtuple('Regridder', ['weights', 'geotransform', 'projection', 'shape'])
+
+
+def _target_lonlat(geotransform, projection, rows, ncols, subsamples):
+    '''Lon/lat of evenly spaced points inside target pixels (sub-function of
+       regrid_weights)
+
+    Args:
+        geotransform:  target geotransform
+        projection:  target projection (wkt or e.g. 'EPSG:102003'; None for lat/lon)
+        rows:  array of target row numbers
+        ncols:  number of target columns
+        subsamples:  points per pixel along each side
+
+    Returns:
+        Arrays of target pixel index, lon, and lat (one value per point)
+    '''
+    offsets = (np.arange(subsamples) + 0.5) / subsamples
+    row_pos = (rows[:, None] + offsets[None, :]).ravel()   # (rows * subsamples)
+    col_pos = (np.arange(ncols)[:, None] + offsets[None, :]).ravel()
+    row_pos, col_pos = np.meshgrid(row_pos, col_pos, indexing='ij')
+    x = geotransform[0] + col_pos * geotransform[1] + row_pos * geotransform[2]
+    y = geotransform[3] + col_pos * geotransform[4] + row_pos * geotransform[5]
+    pixel = np.floor(row_pos).astype(np.int64) * ncols + np.floor(col_pos).astype(np.int64)
+
+    if projection is None:
+        return pixel.ravel(), x.ravel(), y.ravel()
+    source = osr.SpatialReference()
+    source.SetFromUserInput(projection)
+    lonlat = osr.SpatialReference()
+    lonlat.ImportFromEPSG(4326)
+    if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+        ## gdal 3+ otherwise returns EPSG:4326 as (lat, lon)
+        source.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        lonlat.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(source, lonlat)
+    points = np.array(transform.TransformPoints(np.column_stack([x.ravel(), y.ravel()]).tolist()))
+    return pixel.ravel(), points[:, 0], points[:, 1]
+
+def _fractional_index(values, axis):
+    '''Position of values along a regular coordinate axis, in cells; points up
+       to half a cell beyond either end are kept, others are nan (sub-function
+       of regrid_weights)
+
+    Args:
+        values:  coordinates (lat or lon)
+        axis:  cube axis (ascending or descending)
+
+    Returns:
+        Array of fractional indices
+    '''
+    axis = np.asarray(np.ma.filled(axis, np.nan), dtype=float)
+    n = len(axis)
+    if n == 1:
+        return np.where(np.isclose(values, axis[0]), 0.0, np.nan)
+    edges = np.concatenate([[1.5 * axis[0] - 0.5 * axis[1]], axis,
+                            [1.5 * axis[-1] - 0.5 * axis[-2]]])
+    positions = np.concatenate([[-0.5], np.arange(n, dtype=float), [n - 0.5]])
+    order = np.argsort(edges)
+    return np.interp(values, edges[order], positions[order], left=np.nan, right=np.nan)
+
+def _cache_key(cube, geotransform, projection, shape, method, subsamples):
+    '''Hash of everything the weights depend on (sub-function of regrid_weights)'''
+    sha1 = hashlib.sha1()
+    for axis in (cube.lats, cube.lons):
+        sha1.update(np.ascontiguousarray(np.ma.filled(axis, np.nan), dtype=float).tobytes())
+    sha1.update(repr((tuple(float(v) for v in geotransform), projection,
+                      tuple(shape), method, subsamples)).encode('utf-8'))
+    return sha1.hexdigest()
+
+@instrument
+def regrid_weights(cube, geotransform, shape, projection=None, method='bilinear',
+                   subsamples=4, cache_dir=None, block_points=1000000):
+    '''Computes (or loads from cache) the weights from the cube's lat/lon grid
+       to a target raster grid
+
+    Args:
+        cube:  Cube (from general_code.netcdf.open_cube)
+        geotransform:  target geotransform (e.g. ds.GetGeoTransform())
+        shape:  (rows, cols) of the target grid
+        projection:  target projection as wkt (e.g. ds.GetProjection()) or
+            e.g. 'EPSG:102003'; None if the target is also lat/lon
+        method:  'bilinear' (interpolated at pixel centers), or 'conservative'
+            (area-weighted mean of the cells each pixel covers, approximated
+            with subsamples x subsamples points per pixel)
+        subsamples:  points per pixel side for 'conservative'
+        cache_dir:  optional folder for cached weights (.npz, one per grid pair)
+        block_points:  approximate number of points transformed at a time
+
+    Returns:
+        Regridder
+    '''
+    if method not in ('bilinear', 'conservative'):
+        raise ValueError("method must be 'bilinear' or 'conservative', not {0!r}".format(method))
+    nrows, ncols = shape
+    nlat, nlon = len(cube.lats), len(cube.lons)
+    subsamples = subsamples if method == 'conservative' else 1
+
+    cache_path = None
+    if cache_dir is not None:
+        key = _cache_key(cube, geotransform, projection, shape, method, subsamples)
+        cache_path = os.path.join(cache_dir, key + '.npz')
+        if os.path.exists(cache_path):
+            return Regridder(sparse.load_npz(cache_path), geotransform, projection, (nrows, ncols))
+
+    pixels, cells, weights = [], [], []
+    block_rows = max(1, block_points // (ncols * subsamples ** 2))
+    for start in range(0, nrows, block_rows):
+        rows = np.arange(start, min(start + block_rows, nrows))
+        pixel, lon, lat = _target_lonlat(geotransform, projection, rows, ncols, subsamples)
+        lat_idx = _fractional_index(lat, cube.lats)
+        lon_idx = _fractional_index(lon, cube.lons)
+        inside = np.isfinite(lat_idx) & np.isfinite(lon_idx)
+        pixel, lat_idx, lon_idx = pixel[inside], lat_idx[inside], lon_idx[inside]
+
+        if method == 'conservative':
+            i = np.clip(np.floor(lat_idx + 0.5).astype(np.int64), 0, nlat - 1)
+            j = np.clip(np.floor(lon_idx + 0.5).astype(np.int64), 0, nlon - 1)
+            pixels.append(pixel)
+            cells.append(i * nlon + j)
+            weights.append(np.full(len(pixel), 1.0 / subsamples ** 2))
+        else:
+            lat_idx = np.clip(lat_idx, 0, nlat - 1)
+            lon_idx = np.clip(lon_idx, 0, nlon - 1)
+            i0 = np.floor(lat_idx).astype(np.int64)
+            j0 = np.floor(lon_idx).astype(np.int64)
+            t, u = lat_idx - i0, lon_idx - j0
+            i1, j1 = np.minimum(i0 + 1, nlat - 1), np.minimum(j0 + 1, nlon - 1)
+            for i, j, w in ((i0, j0, (1 - t) * (1 - u)), (i0, j1, (1 - t) * u),
+                            (i1, j0, t * (1 - u)), (i1, j1, t * u)):
+                keep = w > 0
+                pixels.append(pixel[keep])
+                cells.append(i[keep] * nlon + j[keep])
+                weights.append(w[keep])
+
+    ## duplicate (pixel, cell) pairs are summed on conversion
+    matrix = sparse.coo_matrix((np.concatenate(weights), (np.concatenate(pixels), np.concatenate(cells))),
+                               shape=(nrows * ncols, nlat * nlon)).tocsr()
+    if cache_path is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        sparse.save_npz(cache_path, matrix)
+    return Regridder(matrix, geotransform, projection, (nrows, ncols))
+
+@instrument
+def regrid(cube, regridder, start_date=None, end_date=None, outpath=None, chunk_days=None):
+    '''Regrids every date in a range with one sparse multiply per chunk of
+       dates; missing cells are left out of each pixel's weighted mean
+
+    Args:
+        cube:  Cube (from general_code.netcdf.open_cube)
+        regridder:  Regridder (from regrid_weights)
+        start_date, end_date:  optional date range (YYYYMMDD)
+        outpath:  optional GeoTIFF path (one band per date, described by the
+            date); if given, chunks are written as they are regridded
+        chunk_days:  dates per multiply (default keeps each chunk near 128 MB)
+
+    Returns:
+        (time, rows, cols) float32 array, or outpath if given
+    '''
+    times = date_range(cube.dates, start_date, end_date)
+    dates = cube.dates[times]
+    weights = regridder.weights
+    nrows, ncols = regridder.shape
+    npixels, ncells = weights.shape
+    chunk_days = chunk_days or max(1, 2 ** 24 // max(npixels, ncells))
+    full_weight = np.asarray(weights.sum(axis=1)).ravel()
+
+    if outpath:
+        ds = gdal.GetDriverByName('GTiff').Create(outpath, ncols, nrows, len(dates),
+                                                  gdal.GDT_Float32, ['BIGTIFF=IF_SAFER'])
+        ds.SetGeoTransform(regridder.geotransform)
+        srs = osr.SpatialReference()
+        if regridder.projection is None:
+            srs.ImportFromEPSG(4326)
+        else:
+            srs.SetFromUserInput(regridder.projection)
+        ds.SetProjection(srs.ExportToWkt())
+    else:
+        result = np.empty((len(dates), nrows, ncols), dtype=np.float32)
+
+    for start in range(0, len(dates), chunk_days):
+        stop = min(start + chunk_days, len(dates))
+        block = cube.data[times.start + start:times.start + stop, :, :]
+        block = np.ma.filled(np.ma.asarray(block, dtype=float), np.nan).reshape(stop - start, -1).T
+        valid = np.isfinite(block)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if valid.all():
+                values = weights.dot(block) / full_weight[:, None]
+            else:
+                values = weights.dot(np.where(valid, block, 0)) / weights.dot(valid.astype(float))
+        values = values.T.reshape(stop - start, nrows, ncols).astype(np.float32)
+
+        if outpath:
+            for k in range(stop - start):
+                band = ds.GetRasterBand(start + k + 1)
+                band.SetNoDataValue(np.nan)
+                band.SetDescription(str(int(dates[start + k])))
+                band.WriteArray(values[k])
+        else:
+            result[start:stop] = values
+
+    if outpath:
+        ds = None   # flush and close
+        return outpath
+    return result
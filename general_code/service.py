@@ -0,0 +1,265 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## asyncio query service for the NetCDF cube, for apps that make many small
+## point/window queries (e.g. one per click). Datasets stay open in a pool,
+## reads run in a thread pool so the event loop stays free, and concurrent
+## requests that need the same block of the cube share a single read.
+## Results are numpy arrays, or Arrow buffers over a local socket:
+##
+##   python -m general_code serve --port 8765
+##
+##   from general_code import service
+##   table = service.request(query='point', filepath='path/to/netcdf_file.nc',
+##                           lat=35, lon=-106, start=20160101, end=20160701)
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import asyncio
+import collections
+import concurrent.futures
+import json
+import socket
+import threading
+
+from ._lazy import LazyModule
+from .netcdf import Cube, date_range, find_nearest
+
+netCDF4 = LazyModule('netCDF4')
+np = LazyModule('numpy')
+pa = LazyModule('pyarrow')
+
+
+#----------------------#
+#-- define functions --#
+#----------------------#
+## cube:  Cube whose 'data' is the open netcdf variable
+## block:  (time, latitude, longitude) shape of one shared point read
+## chunk_time:  days per storage chunk (grid reads are rounded out to these)
+Handle = collections.namedtuple('Handle', ['nc', 'cube', 'block', 'chunk_time'])
+
+
+class QueryService(object):
+    '''Point and window queries on netcdf cubes with pooled handles and
+       coalesced block reads
+
+    Args:
+        max_open:  number of datasets kept open (least recently used are closed)
+        max_workers:  threads for reads
+        time_block:  minimum days per shared point read (rounded up to whole chunks)
+        block_shape:  (latitude, longitude) cells per shared point read for
+            unchunked variables (chunked variables use their chunk shape)
+    '''
+
+    def __init__(self, max_open=8, max_workers=4, time_block=366, block_shape=(8, 8)):
+        self.max_open = max_open
+        self.time_block = time_block
+        self.block_shape = block_shape
+        self.stats = collections.Counter()   # requests, opens, block_reads, grid_reads, coalesced
+        self._handles = collections.OrderedDict()
+        self._pending = {}
+        ## the netCDF-C library is not thread-safe, so file access is
+        ## serialized; the threads keep slow reads off the event loop
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+    def _handle(self, filepath):
+        '''Open handle for a file, opening it (and closing the least recently
+           used one) if needed; call with self._lock held'''
+        if filepath in self._handles:
+            self._handles.move_to_end(filepath)
+            return self._handles[filepath]
+        nc = netCDF4.Dataset(filepath, 'r')
+        variables = nc.variables
+        data = variables['data']
+        cube = Cube(lats=variables['latitude'][:],
+                    lons=variables['longitude'][:],
+                    dates=variables['time'][:],
+                    data=data)
+        chunking = data.chunking()
+        if chunking == 'contiguous':
+            chunking = (1,) + tuple(self.block_shape)
+        ntime = chunking[0] * max(1, -(-self.time_block // chunking[0]))
+        self._handles[filepath] = Handle(nc, cube, (ntime, chunking[1], chunking[2]), chunking[0])
+        self.stats['opens'] += 1
+        while len(self._handles) > self.max_open:
+            self._handles.popitem(last=False)[1].nc.close()
+        return self._handles[filepath]
+
+    def _open(self, filepath):
+        with self._lock:
+            handle = self._handle(filepath)
+        return handle.cube._replace(data=None), handle.block, handle.chunk_time
+
+    def _read_block(self, filepath, index):
+        '''Reads one block (by block index) with missing values as nan'''
+        with self._lock:
+            handle = self._handle(filepath)
+            slices = tuple(slice(i * size, (i + 1) * size) for i, size in zip(index, handle.block))
+            values = handle.cube.data[slices]
+        return np.ma.filled(values.astype(np.result_type(values.dtype, np.float32)), np.nan)
+
+    def _read_window(self, filepath, start, stop):
+        '''Reads the full grid for time indices start:stop with missing values as nan'''
+        with self._lock:
+            values = self._handle(filepath).cube.data[start:stop, :, :]
+        return np.ma.filled(values.astype(np.result_type(values.dtype, np.float32)), np.nan)
+
+    async def _shared(self, key, func, *args):
+        '''Runs func(*args) in the thread pool, or waits on the same call if
+           one is already running'''
+        future = self._pending.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+        else:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+            if key[0] != 'open':
+                self.stats[key[0] + '_reads'] += 1
+        ## shielded, so cancelling one request does not cancel a read that
+        ## other requests are waiting on
+        return await asyncio.shield(future)
+
+    async def axes(self, filepath):
+        '''Lat/lon/date axes (Cube with data None), point block shape, and days
+           per storage chunk of a file'''
+        return await self._shared(('open', filepath), self._open, filepath)
+
+    async def _blocks(self, filepath, times, lat_blocks, lon_blocks, block):
+        indices = [(t, i, j) for t in range(times.start // block[0], (times.stop - 1) // block[0] + 1)
+                   for i in lat_blocks for j in lon_blocks]
+        results = await asyncio.gather(*[self._shared(('block', filepath) + index, self._read_block,
+                                                      filepath, index) for index in indices])
+        return dict(zip(indices, results))
+
+    async def point_time_slice(self, filepath, latitude, longitude, start_date=None, end_date=None):
+        '''Time series of the grid cell nearest to a point
+
+        Args:
+            filepath:  path to netcdf
+            latitude, longitude:  point of interest
+            start_date, end_date:  optional date range (YYYYMMDD)
+
+        Returns:
+            Tuple of (dates, values) arrays
+        '''
+        self.stats['requests'] += 1
+        axes, block, _ = await self.axes(filepath)
+        lat_idx = find_nearest(latitude, axes.lats)
+        lon_idx = find_nearest(longitude, axes.lons)
+        times = date_range(axes.dates, start_date, end_date)
+        if times.stop <= times.start:
+            return axes.dates[times], np.empty(0, dtype=np.float32)
+        i, j = lat_idx // block[1], lon_idx // block[2]
+        blocks = await self._blocks(filepath, times, [i], [j], block)
+        series = np.concatenate([blocks[index][:, lat_idx - i * block[1], lon_idx - j * block[2]]
+                                 for index in sorted(blocks)])
+        offset = times.start - (times.start // block[0]) * block[0]
+        return axes.dates[times], series[offset:offset + times.stop - times.start]
+
+    async def time_slice(self, filepath, start_date, end_date):
+        '''Statewide grid for a date range
+
+        Args:
+            filepath:  path to netcdf
+            start_date, end_date:  date range (YYYYMMDD)
+
+        Returns:
+            Tuple of (dates, (time, latitude, longitude) array)
+        '''
+        self.stats['requests'] += 1
+        axes, _, chunk_time = await self.axes(filepath)
+        times = date_range(axes.dates, start_date, end_date)
+        if times.stop <= times.start:
+            return axes.dates[times], np.empty((0, len(axes.lats), len(axes.lons)), dtype=np.float32)
+        ## one read of just this query's dates, rounded out to whole storage
+        ## chunks (the point blocks would read ~a year of every cell); identical
+        ## concurrent grid requests share it
+        first = (times.start // chunk_time) * chunk_time
+        last = min(-(-times.stop // chunk_time) * chunk_time, len(axes.dates))
+        values = await self._shared(('grid', filepath, first, last), self._read_window,
+                                    filepath, first, last)
+        return axes.dates[times], values[times.start - first:times.stop - first]
+
+    async def query(self, request):
+        '''Answers one request as an Arrow buffer
+
+        Args:
+            request:  dict with 'query' ('point' or 'grid'), 'filepath', and
+                'lat'/'lon' (point), 'start'/'end' (YYYYMMDD; optional for point)
+
+        Returns:
+            Tuple of (header dict, payload bytes): an Arrow IPC stream of a
+            dates/values table for 'point', or an Arrow tensor for 'grid'
+            (dates in the header)
+        '''
+        if request.get('query') == 'point':
+            dates, values = await self.point_time_slice(request['filepath'], request['lat'], request['lon'],
+                                                        request.get('start'), request.get('end'))
+            table = pa.table({'dates': np.asarray(dates), 'values': values})
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return {'ok': True, 'kind': 'table'}, sink.getvalue().to_pybytes()
+        if request.get('query') == 'grid':
+            dates, values = await self.time_slice(request['filepath'], request['start'], request['end'])
+            sink = pa.BufferOutputStream()
+            pa.ipc.write_tensor(pa.Tensor.from_numpy(values), sink)
+            return ({'ok': True, 'kind': 'tensor', 'dates': np.asarray(dates).tolist()},
+                    sink.getvalue().to_pybytes())
+        raise ValueError("query must be 'point' or 'grid', not {0!r}".format(request.get('query')))
+
+    async def handle_connection(self, reader, writer):
+        '''Answers json requests (one per line) with a json header line
+           followed by 'nbytes' bytes of Arrow payload'''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    header, payload = await self.query(json.loads(line.decode('utf-8')))
+                except Exception as e:
+                    header, payload = {'ok': False, 'error': '{0}: {1}'.format(type(e).__name__, e)}, b''
+                header['nbytes'] = len(payload)
+                writer.write(json.dumps(header).encode('utf-8') + b'\n' + payload)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        '''Serves queries on a local socket until cancelled'''
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        '''Closes open datasets and stops the read threads'''
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            while self._handles:
+                self._handles.popitem()[1].nc.close()
+
+
+def request(host='127.0.0.1', port=8765, **query):
+    '''Sends one query to a running service (blocking client)
+
+    Args:
+        host, port:  address of the service
+        query:  request fields (see QueryService.query)
+
+    Returns:
+        pyarrow Table for 'point'; tuple of (dates, array) for 'grid'
+    '''
+    with socket.create_connection((host, port)) as sock, sock.makefile('rb') as stream:
+        sock.sendall(json.dumps(query).encode('utf-8') + b'\n')
+        header = json.loads(stream.readline().decode('utf-8'))
+        payload = stream.read(header['nbytes'])
+    if not header['ok']:
+        raise RuntimeError(header['error'])
+    if header['kind'] == 'table':
+        return pa.ipc.open_stream(pa.py_buffer(payload)).read_all()
+    return np.array(header['dates']), pa.ipc.read_tensor(pa.py_buffer(payload)).to_numpy()
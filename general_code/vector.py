@@ -0,0 +1,222 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## vector helpers from basic_vector_commands.py: batch chloropleth maps,
+## memory-efficient attribute joins, and rasterizing. matplotlib, pandas,
+## and gdal are imported the first time a function uses them.
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import multiprocessing
+import os
+
+from ._lazy import LazyModule
+from .instrumentation import instrument
+
+gdal = LazyModule('osgeo.gdal')
+mcollections = LazyModule('matplotlib.collections')
+mpatches = LazyModule('matplotlib.patches')
+mpath = LazyModule('matplotlib.path')
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+plt = LazyModule('matplotlib.pyplot')
+
+
+#--------------#
+#-- plotting --#
+#--------------#
+_choropleth = {}
+
+def _geometry_patches(geometries):
+    '''Converts (multi)polygons to patches (sub-function of render_choropleths)
+
+    Args:
+        geometries:  list of shapely polygons/multipolygons
+
+    Returns:
+        List of PathPatches, and array of the row index each patch belongs to
+    '''
+    patches, rows = [], []
+    for row, geom in enumerate(geometries):
+        if geom is None or geom.is_empty:
+            continue
+        for poly in getattr(geom, 'geoms', [geom]):
+            rings = [poly.exterior] + list(poly.interiors)
+            path = mpath.Path.make_compound_path(*[mpath.Path(np.asarray(ring.coords)[:, :2]) for ring in rings])
+            patches.append(mpatches.PathPatch(path))
+            rows.append(row)
+    return patches, np.array(rows, dtype=int)
+
+def _init_choropleth_worker(geometries, cmap, figsize, dpi):
+    '''Builds figure, patch collection, and colorbar once per worker process
+
+    Args:
+        geometries:  list of shapely polygons/multipolygons
+        cmap:  matplotlib colormap name
+        figsize:  figure size in inches
+        dpi:  output resolution
+    '''
+    plt.switch_backend('Agg')
+    patches, rows = _geometry_patches(geometries)
+    fig = plt.figure(figsize=figsize, dpi=dpi)
+    ax = fig.add_axes([0.05, 0.05, 0.8, 0.9])
+    collection = mcollections.PatchCollection(patches, cmap=cmap, edgecolor='black', linewidth=0.2)
+    collection.set_array(np.zeros(len(patches)))
+    ax.add_collection(collection)
+    ax.autoscale_view()
+    ax.set_aspect('equal')
+    ax.set_axis_off()
+    cax = fig.add_axes([0.9, 0.1, 0.03, 0.8])
+    fig.colorbar(collection, cax=cax)
+    _choropleth.update(fig=fig, ax=ax, collection=collection, rows=rows)
+
+def _render_choropleth(task):
+    '''Colors the shared collection and writes one map (sub-function of render_choropleths)
+
+    Args:
+        task:  tuple of (title, values, vmin, vmax, outpath)
+
+    Returns:
+        Path of the written image
+    '''
+    title, values, vmin, vmax, outpath = task
+    collection = _choropleth['collection']
+    collection.set_array(np.ma.masked_invalid(values[_choropleth['rows']]))
+    collection.set_clim(vmin, vmax)   # colorbar follows the collection
+    _choropleth['ax'].set_title(title)
+    _choropleth['fig'].savefig(outpath)
+    return outpath
+
+@instrument
+def render_choropleths(gdf, variables, outdir, cmap='viridis', processes=None,
+                       figsize=(8, 8), dpi=100, vmin=None, vmax=None):
+    '''Writes one chloropleth map per variable, building the geometry only once
+       per worker process
+
+    Args:
+        gdf:  geodataframe with geometry and variable columns (e.g. 'merged')
+        variables:  list of columns to map (e.g. one column per variable or date)
+        outdir:  folder for output .png files (named after each variable; created
+            if needed)
+        cmap:  matplotlib colormap name
+        processes:  number of worker processes (default is number of cpus)
+        figsize:  figure size in inches
+        dpi:  output resolution
+        vmin, vmax:  fixed color limits for every map (e.g. a series of dates);
+            default is each variable's own min/max
+
+    Returns:
+        List of written file paths
+    '''
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    geometries = list(gdf.geometry)
+    tasks = []
+    for vrbl in variables:
+        values = np.asarray(gdf[vrbl], dtype=float)
+        vrbl_min = np.nanmin(values) if vmin is None else vmin
+        vrbl_max = np.nanmax(values) if vmax is None else vmax
+        outpath = os.path.join(outdir, str(vrbl) + '.png')
+        tasks.append((str(vrbl), values, vrbl_min, vrbl_max, outpath))
+
+    pool = multiprocessing.Pool(processes, _init_choropleth_worker,
+                                (geometries, cmap, figsize, dpi))
+    try:
+        outpaths = pool.map(_render_choropleth, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    return outpaths
+
+
+#----------------------#
+#-- rasterize vector --#
+#----------------------#
+@instrument
+def new_raster_from_base(base, outputURI, format, nodata, datatype):
+    cols = base.RasterXSize
+    rows = base.RasterYSize
+    projection = base.GetProjection()
+    geotransform = base.GetGeoTransform()
+    bands = base.RasterCount
+
+    driver = gdal.GetDriverByName(format)
+
+    new_raster = driver.Create(str(outputURI), cols, rows, bands, datatype)
+    new_raster.SetProjection(projection)
+    new_raster.SetGeoTransform(geotransform)
+
+    for i in range(bands):
+        new_raster.GetRasterBand(i + 1).SetNoDataValue(nodata)
+        new_raster.GetRasterBand(i + 1).Fill(nodata)
+
+    return new_raster
+
+
+#--------------------#
+#-- attribute join --#
+#--------------------#
+def build_key_index(geom, key='GEOID'):
+    '''Builds a reusable index of join keys from a geodataframe
+
+    Args:
+        geom:  geodataframe to join attributes onto
+        key:  name of the join column
+
+    Returns:
+        pandas Index of keys (as strings), in geometry row order
+    '''
+    keys = pd.Index(geom[key].astype(str))
+    if not keys.is_unique:
+        raise ValueError("join key '{0}' is not unique in the geometry".format(key))
+    return keys
+
+@instrument
+def join_attributes(geom, csv_path, columns, key='GEOID', dtypes=None,
+                    chunksize=100000, key_index=None):
+    '''Inner joins selected csv columns onto a geodataframe
+       (same result as geom.merge(df[[key] + columns], on=key))
+
+    Args:
+        geom:  geodataframe to join attributes onto
+        csv_path:  path to tabular data
+        columns:  list of csv columns to join (besides the key)
+        key:  name of the join column in both tables
+        dtypes:  optional dict of compact dtypes for 'columns' (e.g. {'POP': 'int32'})
+        chunksize:  number of csv rows read at a time
+        key_index:  output of build_key_index (built here if not supplied)
+
+    Returns:
+        Geodataframe with joined columns, in geometry row order
+    '''
+    if key_index is None:
+        key_index = build_key_index(geom, key)
+    key_dtype = pd.CategoricalDtype(categories=key_index)
+    dtype = {key: str}
+    dtype.update(dtypes or {})
+
+    parts = []
+    reader = pd.read_csv(csv_path, usecols=[key] + list(columns),
+                         dtype=dtype, chunksize=chunksize)
+    for chunk in reader:
+        codes = chunk[key].astype(key_dtype).cat.codes.values
+        keep = codes >= 0   # -1 means key is not in the geometry
+        if keep.any():
+            part = chunk.loc[keep, list(columns)]
+            part.index = codes[keep]
+            parts.append(part)
+
+    if parts:
+        table = pd.concat(parts)
+    else:
+        table = pd.DataFrame(columns=list(columns))
+    table = table.sort_index(kind='mergesort')   # geometry row order
+
+    rows = table.index.values.astype(int)
+    merged = geom.iloc[rows].reset_index(drop=True)
+    merged[key] = pd.Categorical(key_index[rows], dtype=key_dtype)
+    for col in columns:
+        merged[col] = table[col].values
+    return merged
@@ -0,0 +1,123 @@
+#-----------------#
+#-- description --#
+#-----------------#
+## checks of the streaming helpers in general_code.data against pandas
+## (run with 'pytest' from the repository root)
+
+
+#----------------------#
+#-- import libraries --#
+#----------------------#
+import json
+import os
+
+import pandas as pd
+
+from general_code import data
+
+
+#--------------------#
+#-- duplicate data --#
+#--------------------#
+def test_stream_drop_duplicates_matches_pandas_across_chunks(tmp_path):
+    ## chunks of 2 rows: the first chunk's keys look like ints, the second's
+    ## like text, so per-chunk dtype inference would hash 1 and '1' differently
+    inpath, outpath = str(tmp_path / 'in.csv'), str(tmp_path / 'out.csv')
+    with open(inpath, 'w') as f:
+        f.write('k,v\n1,a\n2,b\nx,c\n1,d\n')
+
+    for keep in ('first', 'last', False):
+        written = data.stream_drop_duplicates(inpath, outpath, ['k'], keep=keep, chunksize=2)
+        expected = pd.read_csv(inpath).drop_duplicates(['k'], keep=keep)
+        result = pd.read_csv(outpath)
+        assert written == len(expected)
+        assert result['v'].tolist() == expected['v'].tolist()
+
+
+def test_stream_drop_duplicates_copies_rows_unchanged(tmp_path):
+    inpath, outpath = str(tmp_path / 'in.csv'), str(tmp_path / 'out.csv')
+    with open(inpath, 'w') as f:
+        f.write('k,v,w\n007,4,NA\n1,,"a,b"\n007,5,x\n')
+
+    assert data.stream_drop_duplicates(inpath, outpath, ['k'], chunksize=2) == 2
+    with open(outpath) as f:
+        assert f.read() == 'k,v,w\n007,4,NA\n1,,"a,b"\n'
+
+
+#------------------#
+#-- reshape data --#
+#------------------#
+def test_partitioned_pivot_keeps_each_index_in_one_bucket(tmp_path):
+    ## 'id' reads as int in the first chunk and as text in the second
+    inpath, outpath = str(tmp_path / 'long.csv'), str(tmp_path / 'wide.parquet')
+    with open(inpath, 'w') as f:
+        f.write('id,var,val\n1,a,1.0\n2,a,2.0\nx,a,3.0\n1,b,4.0\n')
+
+    nrows = data.partitioned_pivot(inpath, outpath, ['id'], 'var', 'val', nbuckets=8, chunksize=2)
+    wide = pd.read_parquet(outpath).set_index('id').sort_index()
+    expected = pd.read_csv(inpath).pivot(index='id', columns='var', values='val').sort_index()
+    assert nrows == len(expected) == 3
+    assert wide.fillna(-1).values.tolist() == expected.fillna(-1).values.tolist()
+
+
+def test_stream_melt_keeps_id_text_and_value_type_across_chunks(tmp_path):
+    ## the first chunk's values look like ints, the second has a missing one
+    inpath, outpath = str(tmp_path / 'wide.csv'), str(tmp_path / 'long.parquet')
+    with open(inpath, 'w') as f:
+        f.write('GEOID,y2000\n01,1\n02,2\n35,\n36,4.5\n')
+
+    assert data.stream_melt(inpath, outpath, ['GEOID'], chunksize=2) == 4
+    long_df = pd.read_parquet(outpath)
+    assert long_df['GEOID'].tolist() == ['01', '02', '35', '36']
+    assert long_df['value'].fillna(-1).tolist() == [1.0, 2.0, -1, 4.5]
+
+
+#----------------#
+#-- read types --#
+#----------------#
+def _cache_sampled_schema(inpath, nrows):
+    ## cache a schema inferred from the first nrows rows only
+    schema = data.infer_schema(inpath, nrows=nrows)
+    schema['source'] = {'size': os.path.getsize(inpath), 'mtime': os.path.getmtime(inpath)}
+    with open(inpath + '.schema.json', 'w') as f:
+        json.dump(schema, f)
+    return schema
+
+
+def test_read_csv_with_schema_handles_int_chunks_that_are_all_missing(tmp_path):
+    inpath = str(tmp_path / 'in.csv')
+    with open(inpath, 'w') as f:
+        f.write('a,b\n1,1\n2,2\n,3\n,4\n')
+    assert _cache_sampled_schema(inpath, 2)['dtype']['a'].startswith('int')
+
+    df = data.read_csv_with_schema(inpath, chunksize=2)
+    assert df['a'].isna().tolist() == [False, False, True, True]
+    assert df['a'].dropna().tolist() == [1, 2]
+
+
+def test_read_csv_with_schema_reads_decimals_after_the_sample_as_floats(tmp_path):
+    inpath = str(tmp_path / 'in.csv')
+    with open(inpath, 'w') as f:
+        f.write('a\n' + '1\n' * 5 + '2.5\n')
+    assert _cache_sampled_schema(inpath, 5)['dtype']['a'].startswith('int')
+
+    df = data.read_csv_with_schema(inpath, chunksize=2)
+    assert df['a'].tolist() == [1.0] * 5 + [2.5]
+    with open(inpath + '.schema.json') as f:
+        assert json.load(f)['dtype']['a'] == 'float64'
+
+
+#-----------------#
+#-- subset data --#
+#-----------------#
+def test_lazyframe_csv_and_parquet_agree_on_missing_values(tmp_path):
+    df = pd.DataFrame({'a': [1.0, None, 3.0, 1.0], 'b': [1, 2, 3, 4]})
+    csv_path, parquet_path = str(tmp_path / 'df.csv'), str(tmp_path / 'df.parquet')
+    df.to_csv(csv_path, index=False)
+    df.to_parquet(parquet_path, index=False)
+
+    for op, value in [('!=', 1), ('not in', [1]), ('in', [3, None]), ('==', 1), ('>', 1)]:
+        expected = df[data._FILTER_OPS[op](df['a'], value)]['b'].tolist()
+        for path in (csv_path, parquet_path):
+            result = data.LazyFrame(path).filter('a', op, value).select(['b']).collect()
+            assert result['b'].tolist() == expected, (path, op)